@@ -0,0 +1,66 @@
+"""
+End-to-end messages throughput and round trip latency against local loopback mock server.
+
+    python bench/bench_e2e.py
+"""
+from __future__ import print_function
+import time
+import benchutil
+import blynklib
+from blynklib import Protocol
+from mock_server import MockServer
+
+
+class BenchBlynk(blynklib.Blynk):
+    _LOGO = None
+
+
+def echo(server, client, msg_type, msg_id, args):
+    # write to V1 is sent back as write to V2
+    if msg_type == Protocol.MSG_HW and args[:2] == ['vw', '1']:
+        server.virtual_write(2, *args[2:])
+
+
+def benchmarks(scale=1.0):
+    results = []
+    server = MockServer().start()
+    server.on_message = echo
+    blynk = BenchBlynk('1234', server='127.0.0.1', port=server.port)
+    # wait_response returns as soon as incoming data is processed, unlike run() without timer
+    poll = lambda: blynk.wait_response(0.01)
+    try:
+        if not blynk.connect(timeout=5):
+            raise RuntimeError('Mock server connection failed')
+
+        number = max(1, int(20000 * scale))
+        start_time = time.time()
+        for value in range(number):
+            blynk.virtual_write(3, value)
+        if not server.wait_for(lambda: len(server.received) >= number + 2, timeout=60, poll=poll):
+            raise RuntimeError('Messages were not delivered')
+        results.append(benchutil.result('e2e_send_throughput', number / (time.time() - start_time), 'msgs/s'))
+
+        received = []
+
+        @blynk.handle_event('write V2')
+        def echo_handler(pin, value):
+            received.append(time.time())
+
+        latencies = []
+        for value in range(max(10, int(1000 * scale))):
+            send_time = time.time()
+            blynk.virtual_write(1, value)
+            if not server.wait_for(lambda: len(received) > len(latencies), timeout=5, poll=poll):
+                raise RuntimeError('Echo message was not received')
+            latencies.append((received[-1] - send_time) * 1000)
+        results.append(benchutil.result('e2e_rtt_p50', benchutil.percentile(latencies, 50), 'ms'))
+        results.append(benchutil.result('e2e_rtt_p99', benchutil.percentile(latencies, 99), 'ms'))
+    finally:
+        blynk.disconnect()
+        server.stop()
+    return results
+
+
+if __name__ == '__main__':
+    for res in benchmarks():
+        print('{name:<28} {value:>14.3f} {unit}'.format(**res))
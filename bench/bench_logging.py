@@ -0,0 +1,59 @@
+"""
+Cost of logging on message processing path.
+Compares eager log message formatting (library behaviour before lazy logging) with lazy level-aware logging.
+
+    python bench/bench_logging.py
+"""
+from __future__ import print_function
+import benchutil
+import blynklib
+
+
+def null_log(*args):
+    pass
+
+
+class LazyBlynk(blynklib.Blynk):
+    _LOGO = None
+
+
+class EagerBlynk(LazyBlynk):
+    # message strings are built before log call as it was done before lazy logging
+    def _log(self, level, msg, *args):
+        self.log(msg.format(*args) if args else msg)
+
+
+def make_blynk(cls, **kwargs):
+    blynk = cls('1234', **kwargs)
+
+    @blynk.handle_event('write V1')
+    def write_handler(pin, value):
+        pass
+
+    return blynk
+
+
+def bench_process(blynk, number):
+    # one incoming virtual pin write and one server response per call
+    process = blynk.process
+    hw_args = ['vw', '1', '42']
+    seconds = benchutil.per_op(lambda: (process(blynk.MSG_HW, 1, 0, hw_args), process(blynk.MSG_RSP, 2, 200, [])),
+                               number)
+    return seconds / 2 * 1e9
+
+
+def benchmarks(scale=1.0):
+    number = max(1, int(50000 * scale))
+    cases = [
+        ('log_eager_disabled', make_blynk(EagerBlynk)),
+        ('log_lazy_disabled', make_blynk(LazyBlynk)),
+        ('log_eager_level_info', make_blynk(EagerBlynk, log=null_log, log_level=blynklib.LOG_INFO)),
+        ('log_lazy_level_info', make_blynk(LazyBlynk, log=null_log, log_level=blynklib.LOG_INFO)),
+        ('log_lazy_level_debug', make_blynk(LazyBlynk, log=null_log)),
+    ]
+    return [benchutil.result(name, bench_process(blynk, number), 'ns/msg') for name, blynk in cases]
+
+
+if __name__ == '__main__':
+    for res in benchmarks():
+        print('{name:<28} {value:>14.3f} {unit}'.format(**res))
@@ -0,0 +1,69 @@
+"""
+Round trip latency with TCP_NODELAY on and off against local loopback mock server.
+Every round writes two messages back to back and waits for echo of the second one. With Nagle algorithm enabled
+the second write waits for acknowledgement of the first one, which receiver may delay.
+
+    python bench/bench_nodelay.py
+"""
+from __future__ import print_function
+import time
+import benchutil
+import blynklib
+from bench_e2e import echo
+from mock_server import MockServer
+
+
+class NoDelayBlynk(blynklib.Blynk):
+    _LOGO = None
+    TCP_NODELAY = True
+
+
+class NagleBlynk(NoDelayBlynk):
+    TCP_NODELAY = False
+
+
+def bench_rtt(cls, port, rounds):
+    blynk = cls('1234', server='127.0.0.1', port=port)
+    received = []
+
+    @blynk.handle_event('write V2')
+    def echo_handler(pin, value):
+        received.append(time.time())
+
+    latencies = []
+    try:
+        if not blynk.connect(timeout=5):
+            raise RuntimeError('Mock server connection failed')
+        for value in range(rounds):
+            send_time = time.time()
+            blynk.virtual_write(3, value)
+            blynk.virtual_write(1, value)
+            end_time = send_time + 5
+            while len(received) <= len(latencies):
+                if time.time() > end_time:
+                    raise RuntimeError('Echo message was not received')
+                blynk.wait_response(0.01)
+            latencies.append((received[-1] - send_time) * 1000)
+    finally:
+        blynk.disconnect()
+    return latencies
+
+
+def benchmarks(scale=1.0):
+    results = []
+    rounds = max(10, int(100 * scale))
+    server = MockServer().start()
+    server.on_message = echo
+    try:
+        for name, cls in (('nodelay_on', NoDelayBlynk), ('nodelay_off', NagleBlynk)):
+            latencies = bench_rtt(cls, server.port, rounds)
+            results.append(benchutil.result('{}_rtt_p50'.format(name), benchutil.percentile(latencies, 50), 'ms'))
+            results.append(benchutil.result('{}_rtt_p99'.format(name), benchutil.percentile(latencies, 99), 'ms'))
+    finally:
+        server.stop()
+    return results
+
+
+if __name__ == '__main__':
+    for res in benchmarks():
+        print('{name:<28} {value:>14.3f} {unit}'.format(**res))
@@ -0,0 +1,60 @@
+"""
+Protocol encode/decode throughput and handler dispatch cost.
+
+    python bench/bench_protocol.py
+"""
+from __future__ import print_function
+import benchutil
+import blynklib
+
+
+class BenchBlynk(blynklib.Blynk):
+    _LOGO = None
+
+
+def benchmarks(scale=1.0):
+    number = max(1, int(50000 * scale))
+    protocol = blynklib.Protocol()
+    results = []
+
+    results.append(benchutil.result(
+        'encode_pack_msg', 1 / benchutil.per_op(lambda: protocol.virtual_write_msg(1, 123.45), number), 'frames/s'))
+
+    buff = bytearray()
+
+    def pack_into():
+        protocol._pack_into(buff, protocol.MSG_HW, 'vw', 1, 123.45)
+        if len(buff) > 65536:
+            del buff[:]
+
+    results.append(benchutil.result('encode_pack_into', 1 / benchutil.per_op(pack_into, number), 'frames/s'))
+
+    frame = protocol._pack_msg(protocol.MSG_HW, 'vw', 1, 123.45, msg_id=1)
+    results.append(benchutil.result(
+        'decode_parse_response', 1 / benchutil.per_op(lambda: protocol.parse_response(frame, 1024), number),
+        'frames/s'))
+
+    # coalesced frames received with single socket read
+    blynk = BenchBlynk('1234')
+    chunk = frame * 100
+    chunk_number = max(1, number // 100)
+    seconds = benchutil.per_op(lambda: blynk.read_frames(chunk), chunk_number)
+    results.append(benchutil.result('decode_read_frames', 100 / seconds, 'frames/s'))
+
+    @blynk.handle_event('write V1')
+    def write_handler(pin, value):
+        pass
+
+    hw_args = ['vw', '1', '123.45']
+    results.append(benchutil.result(
+        'dispatch_process_vw', benchutil.per_op(lambda: blynk.process(blynk.MSG_HW, 1, 0, hw_args), number) * 1e9,
+        'ns/msg'))
+    # full path of incoming message: frame parsing, args decoding and handler call
+    results.append(benchutil.result(
+        'dispatch_feed_vw', benchutil.per_op(lambda: blynk.feed(frame), number) * 1e9, 'ns/msg'))
+    return results
+
+
+if __name__ == '__main__':
+    for res in benchmarks():
+        print('{name:<28} {value:>14.3f} {unit}'.format(**res))
@@ -0,0 +1,49 @@
+"""
+blynktimer overhead with 16, 256 and 4096 registered timers.
+
+    python bench/bench_timer.py
+"""
+from __future__ import print_function
+import benchutil
+from blynktimer import Timer
+
+TIMERS_NUM = (16, 256, 4096)
+
+
+def make_timer(count, interval):
+    Timer.timers = {}
+    Timer._queue = []
+    Timer._unscheduled = []
+    timer = Timer(max_timers=count + 1)
+    for idx in range(count):
+        timer.register(idx, interval=interval(idx))(lambda idx: None)
+    return timer
+
+
+def benchmarks(scale=1.0):
+    results = []
+    for count in TIMERS_NUM:
+        # all timers are due on every fire
+        timer = make_timer(count, lambda idx: 0)
+        timer.fire()
+        number = max(1, int(200000 * scale) // count)
+        seconds = benchutil.per_op(timer.fire, number)
+        results.append(benchutil.result('timer_fire_all_{}'.format(count), seconds / count * 1e9, 'ns/timer'))
+
+        # one due timer among many waiting ones
+        timer = make_timer(count, lambda idx: 0 if idx == 0 else 3600 + idx)
+        timer.fire()
+        number = max(1, int(50000 * scale))
+        results.append(benchutil.result(
+            'timer_fire_one_of_{}'.format(count), benchutil.per_op(timer.fire, number) * 1e9, 'ns/fire'))
+        results.append(benchutil.result(
+            'timer_next_timeout_{}'.format(count), benchutil.per_op(timer.next_timeout, number) * 1e9, 'ns/call'))
+    Timer.timers = {}
+    Timer._queue = []
+    Timer._unscheduled = []
+    return results
+
+
+if __name__ == '__main__':
+    for res in benchmarks():
+        print('{name:<28} {value:>14.3f} {unit}'.format(**res))
@@ -0,0 +1,24 @@
+"""Helpers shared by benchmarks"""
+import os
+import sys
+import timeit
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+# library modules and test mock server are imported from source tree
+for path in (ROOT, os.path.join(ROOT, 'test')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+def per_op(func, number, repeat=3):
+    """returns the best of repeat runs of seconds spent per func call"""
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def result(name, value, unit):
+    return {'name': name, 'value': value, 'unit': unit}
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100.0))]
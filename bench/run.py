@@ -0,0 +1,94 @@
+"""
+Runs benchmark suites and saves results to JSON file to compare runs.
+
+    python bench/run.py --json before.json
+    python bench/run.py --json after.json --compare before.json
+    python bench/run.py --quick protocol timer
+"""
+from __future__ import print_function
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import benchutil
+import bench_e2e
+import bench_logging
+import bench_nodelay
+import bench_protocol
+import bench_timer
+
+SUITES = (
+    ('protocol', bench_protocol),
+    ('timer', bench_timer),
+    ('logging', bench_logging),
+    ('e2e', bench_e2e),
+    ('nodelay', bench_nodelay),
+)
+# results in these units are better when higher
+HIGHER_BETTER = ('frames/s', 'msgs/s')
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=benchutil.ROOT,
+                                       stderr=subprocess.STDOUT).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    print('\n{:<28} {:>14} {:>14} {:>9}'.format('benchmark', 'baseline', 'current', 'change'))
+    for name, res in sorted(results.items()):
+        base = baseline.get(name)
+        if base is None or not base['value']:
+            continue
+        change = (res['value'] - base['value']) / base['value'] * 100
+        if res['unit'] not in HIGHER_BETTER:
+            change = -change
+        print('{:<28} {:>14.3f} {:>14.3f} {:>+8.1f}%'.format(name, base['value'], res['value'], change))
+    print('(positive change is improvement)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Blynk library benchmarks')
+    parser.add_argument('suites', nargs='*', help='suites to run: {}'.format(', '.join(name for name, _ in SUITES)))
+    parser.add_argument('--quick', action='store_true', help='10 times less iterations')
+    parser.add_argument('--json', help='file to save results to')
+    parser.add_argument('--compare', help='results file of previous run')
+    args = parser.parse_args()
+    unknown = set(args.suites) - set(name for name, _ in SUITES)
+    if unknown:
+        parser.error('unknown suites: {}'.format(', '.join(sorted(unknown))))
+
+    results = {}
+    for name, module in SUITES:
+        if args.suites and name not in args.suites:
+            continue
+        for res in module.benchmarks(0.1 if args.quick else 1.0):
+            print('{name:<28} {value:>14.3f} {unit}'.format(**res))
+            sys.stdout.flush()
+            results[res['name']] = {'value': res['value'], 'unit': res['unit'], 'suite': name}
+
+    report = {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'quick': args.quick,
+        },
+        'results': results,
+    }
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump(report, json_file, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as json_file:
+            compare(results, json.load(json_file)['results'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+# Copyright (c) 2019-2020 Anton Morozenko
+# See the file LICENSE for copying permission.
+"""
+Gateway that serves many Blynk devices (auth tokens) in one process.
+Every device is a separate Blynk session with own event handlers. Session sockets are non-blocking and are
+served by single selectors loop, so connect, auth and data exchange of one device never block others.
+Requires Python 3.4+
+"""
+import errno
+import os
+import selectors
+import socket
+import ssl
+import time
+
+from blynklib import Blynk, BlynkError, RedirectError, LOGO, LOG_ERROR, LOG_INFO, get_ident, stub_log, ticks_ms
+
+
+class GatewayDevice(Blynk):
+    _LOGO = None
+
+    def connect(self, timeout=None):
+        raise BlynkError('Gateway device connection is managed by BlynkGateway')
+
+    def run(self):
+        raise BlynkError('Gateway device is served by BlynkGateway.run')
+
+
+class _Session(object):
+    # handshake stages
+    TCP = 1
+    TLS = 2
+    LOGIN = 3
+    HEARTBEAT = 4
+    READY = 5
+
+    def __init__(self, device):
+        self.device = device
+        self.stage = None
+        self.deadline = 0
+        self.reconnect_at = 0
+        self.events = 0
+
+
+class BlynkGateway(object):
+    SELECT_TIMEOUT = 0.05
+    CHECK_PERIOD = 100  # ms
+
+    def __init__(self, log=stub_log):
+        self.log = log
+        self._selector = selectors.DefaultSelector()
+        self._sessions = {}
+        self._next_check = 0
+        print(LOGO)
+
+    def add_device(self, token, **kwargs):
+        device = GatewayDevice(token, **kwargs)
+        self._sessions[device] = _Session(device)
+        return device
+
+    def remove_device(self, device):
+        session = self._sessions.pop(device)
+        if session.stage is not None:
+            self._close(session)
+
+    def devices(self):
+        return list(self._sessions.keys())
+
+    def connected(self):
+        return [device for device, session in self._sessions.items() if session.stage == _Session.READY]
+
+    def run(self, timeout=SELECT_TIMEOUT):
+        now = ticks_ms()
+        if now >= self._next_check:
+            self._next_check = now + self.CHECK_PERIOD
+            self._check_sessions(now)
+        # data sent by blocking handlers from thread pool, messages delayed by rate limit and stored offline
+        # messages are written here
+        thread_id = get_ident()
+        for device, session in self._sessions.items():
+            device._io_thread_id = thread_id
+            if session.stage == session.READY:
+                if device._tx_queue or device._tx_pending or device.offline_store:
+                    device.flush_tx_queue()
+                # data which socket did not accept at once is written when it becomes writable
+                events = selectors.EVENT_READ | (selectors.EVENT_WRITE if device._tx_buffer else 0)
+                if events != session.events:
+                    self._select(session, events)
+        if not self._selector.get_map():
+            # select on empty descriptors list fails on some platforms
+            time.sleep(timeout)
+            return
+        for key, mask in self._selector.select(timeout):
+            session = key.data
+            try:
+                self._handle_event(session, mask)
+            except KeyboardInterrupt:
+                raise
+            except RedirectError as r_err:
+                self._close(session)
+                session.device.server = r_err.server
+                session.device.port = r_err.port
+                session.reconnect_at = 0
+            except (BlynkError, IOError, OSError) as err:
+                self._close(session, err)
+            except Exception as g_exc:
+                session.device._log(LOG_ERROR, '{}', g_exc)
+
+    def _check_sessions(self, now):
+        for session in list(self._sessions.values()):
+            device = session.device
+            try:
+                if session.stage is None:
+                    if now >= session.reconnect_at:
+                        self._start_connect(session, now)
+                elif session.stage != session.READY:
+                    if now >= session.deadline:
+                        raise BlynkError('Connection stage={} timeout'.format(session.stage))
+                elif not device.is_server_alive():
+                    raise BlynkError('Blynk server is offline')
+            except (BlynkError, IOError, OSError) as err:
+                self._close(session, err)
+
+    def _start_connect(self, session, now):
+        device = session.device
+        device._state = device.CONNECTING
+        device._rx_buffer = bytearray()
+        # cached addresses are tried in turn on each reconnect attempt
+        addrs = device._resolve()
+        family, sock_addr = addrs[device._reconnect_attempt % len(addrs)]
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        device._tune_socket(sock)
+        device._socket = sock
+        sock.setblocking(False)
+        err = sock.connect_ex(sock_addr)
+        if err not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EAGAIN, getattr(errno, 'WSAEWOULDBLOCK', 0)):
+            raise BlynkError('Connection with the Blynk server failed: {}'.format(os.strerror(err)))
+        session.stage = session.TCP
+        session.deadline = now + device.SOCK_MAX_TIMEOUT * 1000
+        session.events = selectors.EVENT_WRITE
+        self._selector.register(sock, selectors.EVENT_WRITE, session)
+
+    def _handle_event(self, session, mask):
+        device = session.device
+        if session.stage == session.TCP:
+            err = device._socket.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if err:
+                raise BlynkError('Connection with the Blynk server failed: {}'.format(os.strerror(err)))
+            device._log(LOG_INFO, 'Connected to blynk server')
+            if not device.ssl_cert:
+                self._login(session)
+                return
+            device._log(LOG_INFO, 'Using SSL socket...')
+            self._selector.unregister(device._socket)
+            device._socket = device._wrap_ssl(device._socket, do_handshake_on_connect=False)
+            self._selector.register(device._socket, session.events, session)
+            session.stage = session.TLS
+        if session.stage == session.TLS:
+            try:
+                device._socket.do_handshake()
+            except ssl.SSLWantReadError:
+                self._select(session, selectors.EVENT_READ)
+                return
+            except ssl.SSLWantWriteError:
+                self._select(session, selectors.EVENT_WRITE)
+                return
+            device._ssl_established()
+            self._login(session)
+        else:
+            if mask & selectors.EVENT_WRITE:
+                device._flush_socket()
+            if mask & selectors.EVENT_READ:
+                self._read(session)
+
+    def _select(self, session, events):
+        session.events = events
+        self._selector.modify(session.device._socket, events, session)
+
+    def _login(self, session):
+        device = session.device
+        device._log(LOG_INFO, 'Authenticating device...')
+        device._state = device.AUTHENTICATING
+        self._select(session, selectors.EVENT_READ)
+        session.stage = session.LOGIN
+        device.send(device.login_msg(device.token))
+
+    def _read(self, session):
+        device = session.device
+        sock = device._socket
+        while True:
+            try:
+                rsp_data = sock.recv(device.rcv_buffer)
+                if device.metrics is not None:
+                    device.metrics.inc('blynk_rx_reads_total')
+            except (ssl.SSLWantReadError, ssl.SSLWantWriteError, BlockingIOError):
+                return
+            if not rsp_data:
+                raise BlynkError('Connection closed by server')
+            device._last_rcv_time = ticks_ms()
+            if session.stage == session.READY:
+                device.feed(rsp_data)
+            else:
+                self._handshake(session, device.read_frames(rsp_data))
+            # ssl socket may keep already decrypted data which is not signaled by selector
+            if not getattr(sock, 'pending', None) or not sock.pending() or device._socket is not sock:
+                return
+
+    def _handshake(self, session, frames):
+        device = session.device
+        for idx, (msg_type, msg_id, status, msg_args) in enumerate(frames):
+            if session.stage == session.LOGIN:
+                device._check_auth_response(msg_type, status, msg_args)
+                session.stage = session.HEARTBEAT
+                device.send(device.heartbeat_msg(device.heartbeat, device.rcv_buffer))
+            elif session.stage == session.HEARTBEAT:
+                device._check_heartbeat_response(status)
+                session.stage = session.READY
+                device._last_rcv_time = ticks_ms()
+                device._reconnect_attempt = 0
+                device._connected_metrics()
+                device._log(LOG_INFO, 'Registered events: {}\n', list(device._events.keys()))
+                device.call_handler(device._CONNECT)
+            else:
+                device.process(msg_type, msg_id, status, msg_args)
+
+    def _close(self, session, err_msg=None):
+        device = session.device
+        if device._socket is not None:
+            try:
+                self._selector.unregister(device._socket)
+            except (KeyError, ValueError):
+                pass
+        if device.metrics is not None and session.stage != session.READY:
+            device.metrics.inc('blynk_connect_failures_total')
+        device.disconnect(err_msg)
+        device._socket = None
+        session.stage = None
+        session.reconnect_at = device._reconnect_at
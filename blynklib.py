@@ -4,10 +4,28 @@
 
 __version__ = '0.2.6'
 
+import errno
+import os
+import random
+import select
 import socket
 import ssl
 import struct
 import time
+from collections import deque, OrderedDict
+from contextlib import contextmanager
+
+try:
+    from threading import get_ident, local, Lock
+except ImportError:
+    # python2
+    from thread import get_ident, _local as local, allocate_lock as Lock
+
+try:
+    # python2 requires 'futures' package backport
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    ThreadPoolExecutor = None
 
 LOGO = """
         ___  __          __
@@ -17,16 +35,31 @@ LOGO = """
             /___/ for Python v{}\n""".format(__version__)
 
 
+# log levels. Messages below level set by log_level are not formatted at all
+LOG_DEBUG = 10
+LOG_INFO = 20
+LOG_WARNING = 30
+LOG_ERROR = 40
+
+
 def stub_log(*args):
     pass
 
 
+try:
+    # intervals are measured with monotonic clock, so system time changes do not affect them
+    monotonic = time.monotonic
+except AttributeError:
+    # python2
+    monotonic = time.time
+
+
 def ticks_ms():
-    return int(time.time() * 1000)
+    return int(monotonic() * 1000)
 
 
 def sleep_ms(ms):
-    time.sleep(ms // 1000)
+    time.sleep(ms / 1000.0)
 
 
 class BlynkError(Exception):
@@ -53,28 +86,50 @@ class Protocol(object):
     MSG_HW = 20
     MSG_REDIRECT = 41
     MSG_HEAD_LEN = 5
+    MSG_HEAD = struct.Struct('!BHH')
+    _MSG_HEAD_STUB = bytes(bytearray(MSG_HEAD_LEN))
 
     STATUS_INVALID_TOKEN = 9
     STATUS_NO_DATA = 17
     STATUS_OK = 200
-    VPIN_MAX_NUM = 32
+    VPIN_MAX_NUM = 255
 
     _msg_id = 0
+    # message ids are taken both by io thread and by worker threads sending directly
+    _msg_id_lock = Lock()
+    # blynkmetrics.Registry. Metrics are not collected if it is not set
+    metrics = None
 
     def _get_msg_id(self, **kwargs):
         if 'msg_id' in kwargs:
             return kwargs['msg_id']
-        self._msg_id += 1
-        return self._msg_id if self._msg_id <= 0xFFFF else 1
+        with self._msg_id_lock:
+            # ids wrap around from 0xFFFF to 1. Zero id is not used
+            self._msg_id = self._msg_id % 0xFFFF + 1
+            return self._msg_id
+
+    def _pack_into(self, buff, msg_type, *args, **kwargs):
+        # appends message to outbound bytearray without intermediate message object
+        # header space is reserved first and filled in place when body length is known
+        msg_start = len(buff)
+        buff += self._MSG_HEAD_STUB
+        buff += ('\0'.join([str(curr_arg) for curr_arg in args])).encode('utf-8')
+        self.MSG_HEAD.pack_into(buff, msg_start, msg_type, self._get_msg_id(**kwargs),
+                                len(buff) - msg_start - self.MSG_HEAD_LEN)
+        if self.metrics is not None:
+            self.metrics.inc('blynk_tx_frames_total')
+        return len(buff) - msg_start
 
     def _pack_msg(self, msg_type, *args, **kwargs):
         data = ('\0'.join([str(curr_arg) for curr_arg in args])).encode('utf-8')
-        return struct.pack('!BHH', msg_type, self._get_msg_id(**kwargs), len(data)) + data
+        if self.metrics is not None:
+            self.metrics.inc('blynk_tx_frames_total')
+        return self.MSG_HEAD.pack(msg_type, self._get_msg_id(**kwargs), len(data)) + data
 
     def parse_response(self, rsp_data, msg_buffer):
         msg_args = []
         try:
-            msg_type, msg_id, h_data = struct.unpack('!BHH', rsp_data[:self.MSG_HEAD_LEN])
+            msg_type, msg_id, h_data = self.MSG_HEAD.unpack_from(rsp_data)
         except Exception as p_err:
             raise BlynkError('Message parse error: {}'.format(p_err))
         if msg_id == 0:
@@ -90,6 +145,39 @@ class Protocol(object):
             raise BlynkError("Unknown message type: '{}'".format(msg_type))
         return msg_type, msg_id, h_data, msg_args
 
+    def parse_frame(self, buff_view, offset, msg_buffer):
+        # buff_view is a memoryview over receive buffer. Header is unpacked in place and only message body
+        # is copied out of buffer. Returns None if message is not complete yet
+        if len(buff_view) - offset < self.MSG_HEAD_LEN:
+            return None
+        msg_type, msg_id, h_data = self.MSG_HEAD.unpack_from(buff_view, offset)
+        if msg_id == 0:
+            raise BlynkError('invalid msg_id == 0')
+        elif h_data >= msg_buffer:
+            raise BlynkError('Command too long. Length = {}'.format(h_data))
+        elif msg_type == self.MSG_RSP:
+            return msg_type, msg_id, h_data, [], self.MSG_HEAD_LEN
+        msg_len = self.MSG_HEAD_LEN + h_data
+        if len(buff_view) - offset < msg_len:
+            return None
+        if msg_type == self.MSG_PING:
+            msg_args = []
+        elif msg_type in (self.MSG_HW, self.MSG_BRIDGE, self.MSG_INTERNAL, self.MSG_REDIRECT):
+            msg_body = buff_view[offset + self.MSG_HEAD_LEN: offset + msg_len].tobytes()
+            msg_args = [itm.decode('utf-8') for itm in msg_body.split(b'\0')]
+        else:
+            raise BlynkError("Unknown message type: '{}'".format(msg_type))
+        return msg_type, msg_id, h_data, msg_args, msg_len
+
+    def frame_len(self, rsp_data, offset=0):
+        # response message carries status code in header length field and has no body
+        if len(rsp_data) - offset < self.MSG_HEAD_LEN:
+            return 0
+        msg_type, _, h_data = self.MSG_HEAD.unpack_from(rsp_data, offset)
+        if msg_type == self.MSG_RSP:
+            return self.MSG_HEAD_LEN
+        return self.MSG_HEAD_LEN + h_data
+
     def heartbeat_msg(self, heartbeat, rcv_buffer):
         return self._pack_msg(self.MSG_INTERNAL, 'ver', __version__, 'buff-in', rcv_buffer, 'h-beat', heartbeat,
                               'dev', 'python')
@@ -97,8 +185,8 @@ class Protocol(object):
     def login_msg(self, token):
         return self._pack_msg(self.MSG_LOGIN, token)
 
-    def ping_msg(self):
-        return self._pack_msg(self.MSG_PING)
+    def ping_msg(self, **kwargs):
+        return self._pack_msg(self.MSG_PING, **kwargs)
 
     def response_msg(self, *args, **kwargs):
         return self._pack_msg(self.MSG_RSP, *args, **kwargs)
@@ -131,9 +219,27 @@ class Connection(Protocol):
     SOCK_SSL_TIMEOUT = 1
     EAGAIN = 11
     ETIMEDOUT = 60
-    RETRIES_TX_DELAY = 2
-    RETRIES_TX_MAX_NUM = 3
+    TX_BUFFER_MAX = 65536
+    DNS_TTL = 300  # sec
+    CONNECT_STAGGER = 250  # ms
+    # socket options applied before connect
+    # Nagle algorithm with delayed ack may hold small messages for ~40ms, so it is disabled by default
+    TCP_NODELAY = True
+    TCP_KEEPALIVE = None  # (idle sec, interval sec, probes count) enables TCP keepalive
+    SOCK_RCVBUF = None  # bytes. None keeps system default
+    SOCK_SNDBUF = None
+    # round trip time is measured for pings. Stats are calculated over last RTT_SAMPLES responses
+    RTT_SAMPLES = 100
+    RTT_PENDING_MAX = 8
+    # adaptive heartbeat pings server more often when last rtt exceeds RTT_DEGRADE_RATIO * min rtt
+    # (and RTT_DEGRADE_MIN ms) or ping response is not received in that time
+    ADAPTIVE_HEARTBEAT = False
+    RTT_DEGRADE_RATIO = 3
+    RTT_DEGRADE_MIN = 50
+    # reconnect delay grows exponentially from RECONNECT_SLEEP up to RECONNECT_MAX_SLEEP seconds
     RECONNECT_SLEEP = 1
+    RECONNECT_MAX_SLEEP = 60
+    REPLAY_RATE_LIMIT = 50
     TASK_PERIOD_RES = 50
     DISCONNECTED = 0
     CONNECTING = 1
@@ -142,44 +248,275 @@ class Connection(Protocol):
 
     _state = None
     _socket = None
+    _rx_buffer = None
+    _tx_buffer = None
+    _tx_queue = None
+    _tx_pending = None
+    _io_thread_id = None
     _last_rcv_time = 0
     _last_ping_time = 0
     _last_send_time = 0
+    _reconnect_attempt = 0
+    _reconnect_at = 0
+    # (host, port) -> (expire time ms, [(family, sockaddr), ...]) shared by all connections
+    _dns_cache = {}
+    # ssl_cert -> SSLContext shared by all connections so CA file is loaded once per process
+    _ssl_contexts = {}
+    # (server, SSLSession) of previous connection used for TLS session resumption
+    _ssl_session = None
+    ssl_session_reused = False
 
     def __init__(self, token, server='blynk-cloud.com', port=80, ssl_cert=None, heartbeat=10, rcv_buffer=1024,
-                 log=stub_log):
+                 log=stub_log, rate_limit=None, rate_burst=None, offline_store=None, metrics=None,
+                 log_level=LOG_DEBUG):
         self.token = token
         self.server = server
         self.port = port
         self.heartbeat = heartbeat
         self.rcv_buffer = rcv_buffer
         self.log = log
+        self.log_level = log_level
         self.ssl_cert = ssl_cert
+        # rate_limit - max number of outgoing messages per second, rate_burst - max number of messages sent at once
+        # messages over the limit wait in pending queue where writes to the same virtual pin are coalesced
+        if offline_store is not None and rate_limit is None:
+            # replayed messages must not exceed server throttling limit
+            rate_limit = self.REPLAY_RATE_LIMIT
+        self.rate_limit = rate_limit
+        self.rate_burst = rate_burst or rate_limit
+        self._tokens = self.rate_burst
+        self._tokens_time = ticks_ms()
+        self._tx_seq = 0
+        self._rx_buffer = bytearray()
+        self._tx_buffer = bytearray()
+        self._tx_queue = deque()
+        self._tx_pending = OrderedDict()
+        # batch() buffers are kept per thread, so worker thread batch does not collect io thread messages
+        self._local = local()
+        # ping msg_id -> send time. Oldest entries are dropped if responses are lost
+        self._rtt_pending = OrderedDict()
+        self._rtt_samples = deque(maxlen=self.RTT_SAMPLES)
+        self._rtt_min = None
+        # blynkstore.OfflineStore keeps messages sent while disconnected. They are replayed after connect
+        self.offline_store = offline_store
+        self.metrics = metrics
+
+    def _log(self, level, msg, *args):
+        # message is formatted only if it is logged, so disabled logging costs no string building on hot paths
+        if self.log is not stub_log and level >= self.log_level:
+            self.log(msg.format(*args) if args else msg)
+
+    @property
+    def _batch(self):
+        return getattr(self._local, 'batch', None)
+
+    @_batch.setter
+    def _batch(self, batch):
+        self._local.batch = batch
+
+    def _off_io_thread(self):
+        # data sent from worker threads is queued and written to socket by io loop thread
+        return self._io_thread_id is not None and get_ident() != self._io_thread_id
 
     def send(self, data):
-        retries = self.RETRIES_TX_MAX_NUM
-        while retries > 0:
-            try:
-                retries -= 1
-                self._last_send_time = ticks_ms()
-                return self._socket.send(data)
-            except (IOError, OSError):
-                sleep_ms(self.RETRIES_TX_DELAY)
+        # data is appended to outgoing buffer and written to socket as much as it accepts without blocking
+        # the rest is written by run loop when socket becomes writable
+        if self._batch is not None:
+            self._batch += data
+            return len(data)
+        if self._off_io_thread():
+            self._tx_queue.append((None, data))
+            return len(data)
+        if self._socket is None:
+            return None
+        if len(self._tx_buffer) + len(data) > self.TX_BUFFER_MAX:
+            self._log(LOG_ERROR, '[ERROR]: TX buffer is full. Buffered={}', len(self._tx_buffer))
+            return 0
+        self._tx_buffer += data
+        try:
+            self._flush_socket()
+        except BlynkError as b_err:
+            self._log(LOG_ERROR, '{}', b_err)
+            return None
+        finally:
+            if self.metrics is not None:
+                self.metrics.set('blynk_tx_buffered_bytes', len(self._tx_buffer))
+        return len(data)
 
-    def receive(self, length, timeout):
-        d_buff = b''
+    def send_all(self, data):
+        return self.send(data)
+
+    def tx_buffered(self):
+        """returns number of bytes waiting in outgoing buffer"""
+        return len(self._tx_buffer)
+
+    def _flush_socket(self):
         try:
-            self._socket.settimeout(timeout)
-            d_buff += self._socket.recv(length)
-            if len(d_buff) >= length:
-                d_buff = d_buff[:length]
-            return d_buff
+            sent = self._socket.send(self._tx_buffer)
+        except (ssl.SSLWantWriteError, ssl.SSLWantReadError, socket.timeout):
+            sent = 0
         except (IOError, OSError) as err:
-            if 'timed out' in str(err):
-                return b''
-            if str(self.EAGAIN) in str(err) or str(self.ETIMEDOUT) in str(err):
+            if err.errno not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.ENOBUFS):
+                # partially written message can not be recovered
+                self._tx_buffer = bytearray()
+                if self.metrics is not None:
+                    self.metrics.inc('blynk_tx_errors_total')
+                raise BlynkError('Socket send failed: {}'.format(err))
+            sent = 0
+        if sent:
+            self._last_send_time = ticks_ms()
+            del self._tx_buffer[:sent]
+        if self.metrics is not None:
+            self.metrics.inc('blynk_tx_bytes_total', sent)
+            if self._tx_buffer:
+                self.metrics.inc('blynk_tx_partial_writes_total')
+
+    def _send_limited(self, data, key=None):
+        # key identifies message that can be replaced by newer one while it waits in pending queue
+        # returns len(data) if message is accepted: written, buffered, queued, delayed by rate limit or stored.
+        # None or 0 is returned if message is rejected like it is done by send()
+        if self._off_io_thread():
+            if self._batch is not None:
+                # worker thread batch is queued as one message when context exits
+                return self.send(data)
+            self._tx_queue.append((key, data))
+            return len(data)
+        if self.offline_store is not None and (self.offline_store or not self.connected()):
+            # new messages are stored till replay ends to keep messages order
+            if not self.offline_store.put(data):
+                return None
+            if self.metrics is not None:
+                self.metrics.inc('blynk_tx_stored_total')
+            return len(data)
+        return self._send_rated(data, key)
+
+    def _send_rated(self, data, key=None):
+        if self.rate_limit is None:
+            return self.send(data)
+        # messages within batch() are limited the same way: over the limit or behind pending ones they wait in queue
+        if not self._tx_pending:
+            self._refill_tokens()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return self.send(data)
+        if key is None:
+            self._tx_seq += 1
+            key = self._tx_seq
+        elif self.metrics is not None and key in self._tx_pending:
+            self.metrics.inc('blynk_tx_coalesced_total')
+        # replaced message keeps its place in queue
+        self._tx_pending[key] = data
+        return len(data)
+
+    def _refill_tokens(self):
+        now = ticks_ms()
+        self._tokens = min(self.rate_burst, self._tokens + (now - self._tokens_time) * self.rate_limit / 1000.0)
+        self._tokens_time = now
+
+    def tx_delay(self):
+        """returns seconds till pending or stored messages can be sent or None if there is nothing to send"""
+        if not self._tx_pending:
+            return 0 if self.offline_store and self.connected() else None
+        self._refill_tokens()
+        return max(0, (1 - self._tokens) / float(self.rate_limit))
+
+    def flush_tx_queue(self):
+        # sends data queued by worker threads, stored offline messages and pending messages allowed by rate limit
+        data = bytearray()
+        while self._tx_queue:
+            key, msg = self._tx_queue.popleft()
+            if self.rate_limit is None:
+                data += msg
+            else:
+                self._send_limited(msg, key)
+        if self.offline_store and self.connected():
+            # replayed messages get new ids of current session
+            while self.offline_store and len(self._tx_pending) < self.rate_burst:
+                msg = bytearray(self.offline_store.get())
+                struct.pack_into('!H', msg, 1, self._get_msg_id())
+                self._tx_seq += 1
+                self._tx_pending[self._tx_seq] = msg
+        if self._tx_pending:
+            self._refill_tokens()
+            while self._tx_pending and self._tokens >= 1:
+                self._tokens -= 1
+                data += self._tx_pending.popitem(last=False)[1]
+        if data:
+            self.send_all(data)
+
+    @contextmanager
+    def batch(self):
+        # messages sent within context are collected into one buffer and flushed with single sendall call
+        # nested batch joins outer one. Collected messages are dropped if context exits with exception
+        # batch entered by worker thread is passed to io thread as one queued message
+        if self._batch is not None:
+            yield self
+            return
+        batch = self._batch = bytearray()
+        try:
+            yield self
+        finally:
+            self._batch = None
+        if batch:
+            self.send_all(batch)
+
+    def receive(self, length, timeout):
+        if self.metrics is not None:
+            self.metrics.inc('blynk_rx_reads_total')
+        # socket is non-blocking after connect, so data is waited with select till timeout expires.
+        # Readable ssl socket may have no application data, ex. TLS 1.3 session ticket sent after handshake,
+        # so would-block read is retried while time is left
+        end_time = monotonic() + timeout
+        wait = timeout
+        want_write = False
+        while True:
+            try:
+                # ssl socket may keep already decrypted data which is not signaled by select
+                if wait > 0 and not (getattr(self._socket, 'pending', None) and self._socket.pending()):
+                    select.select([self._socket], [self._socket] if want_write else [], [], wait)
+                d_buff = self._socket.recv(length)
+                if not d_buff:
+                    # timeouts are handled below, so empty read means end of stream
+                    raise BlynkError('Connection closed by server')
+                if len(d_buff) >= length:
+                    d_buff = d_buff[:length]
+                return d_buff
+            except (ssl.SSLWantReadError, ssl.SSLWantWriteError) as err:
+                want_write = isinstance(err, ssl.SSLWantWriteError)
+            except (IOError, OSError) as err:
+                if not (err.errno in (errno.EAGAIN, errno.EWOULDBLOCK) or 'timed out' in str(err) or
+                        str(self.EAGAIN) in str(err) or str(self.ETIMEDOUT) in str(err)):
+                    raise
+            wait = end_time - monotonic()
+            if wait <= 0:
                 return b''
+
+    def read_frames(self, rsp_data):
+        # received chunk may contain several coalesced messages and incomplete message tail
+        # tail is kept in connection buffer till the rest of message is received
+        frames = []
+        offset = 0
+        self._rx_buffer.extend(rsp_data)
+        buff_view = memoryview(self._rx_buffer)
+        try:
+            while True:
+                frame = self.parse_frame(buff_view, offset, self.rcv_buffer)
+                if frame is None:
+                    break
+                frames.append(frame[:4])
+                offset += frame[4]
+        except BlynkError:
+            if self.metrics is not None:
+                self.metrics.inc('blynk_rx_parse_errors_total')
             raise
+        finally:
+            # buffer can not be resized while memoryview export exists
+            del buff_view
+        del self._rx_buffer[:offset]
+        if self.metrics is not None:
+            self.metrics.inc('blynk_rx_bytes_total', len(rsp_data))
+            self.metrics.inc('blynk_rx_frames_total', len(frames))
+        return frames
 
     def is_server_alive(self):
         now = ticks_ms()
@@ -189,39 +526,215 @@ class Connection(Protocol):
         send_delta = now - self._last_send_time
         if rcv_delta > h_beat_ms + (h_beat_ms // 2):
             return False
-        if (ping_delta > h_beat_ms // 10) and (send_delta > h_beat_ms or rcv_delta > h_beat_ms):
-            self.send(self.ping_msg())
-            self.log('Heartbeat time: {}'.format(now))
+        # degraded connection is checked with 4 times shorter idle period
+        idle_ms = h_beat_ms // 4 if self.ADAPTIVE_HEARTBEAT and self.rtt_degraded() else h_beat_ms
+        if (ping_delta > h_beat_ms // 10) and (send_delta > idle_ms or rcv_delta > idle_ms):
+            msg_id = self._get_msg_id()
+            self.send(self.ping_msg(msg_id=msg_id))
+            self._rtt_pending[msg_id] = monotonic()
+            if len(self._rtt_pending) > self.RTT_PENDING_MAX:
+                self._rtt_pending.popitem(last=False)
+            self._log(LOG_DEBUG, 'Heartbeat time: {}', now)
             self._last_ping_time = now
         return True
 
+    def _rtt_response(self, msg_id):
+        send_time = self._rtt_pending.pop(msg_id, None)
+        if send_time is not None:
+            rtt = (monotonic() - send_time) * 1000
+            self._rtt_samples.append(rtt)
+            if self.metrics is not None:
+                self.metrics.observe('blynk_ping_rtt_seconds', rtt / 1000.0)
+            if self._rtt_min is None or rtt < self._rtt_min:
+                self._rtt_min = rtt
+
+    def rtt_stats(self):
+        """returns dict with min, avg, p99 and last round trip time in ms or None if there are no measurements"""
+        if not self._rtt_samples:
+            return None
+        samples = sorted(self._rtt_samples)
+        return {'min': self._rtt_min,
+                'avg': sum(samples) / len(samples),
+                'p99': samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+                'last': self._rtt_samples[-1],
+                'count': len(samples)}
+
+    def rtt_degraded(self):
+        if self._rtt_min is None:
+            return False
+        limit = max(self.RTT_DEGRADE_RATIO * self._rtt_min, self.RTT_DEGRADE_MIN)
+        if self._rtt_samples[-1] > limit:
+            return True
+        # response that is late already is taken into account before it arrives
+        return bool(self._rtt_pending) and (monotonic() - next(iter(self._rtt_pending.values()))) * 1000 > limit
+
+    def _schedule_reconnect(self):
+        # exponential backoff with full jitter. Random delay spreads reconnects of many devices after server restart
+        max_delay = min(self.RECONNECT_MAX_SLEEP, self.RECONNECT_SLEEP * 2 ** min(self._reconnect_attempt, 16))
+        delay = random.uniform(0, max_delay)
+        self._reconnect_attempt += 1
+        self._reconnect_at = ticks_ms() + int(delay * 1000)
+        return delay
+
+    def _get_ssl_context(self):
+        ssl_context = self._ssl_contexts.get(self.ssl_cert)
+        if ssl_context is None:
+            # system default CA certificates case
+            cafile = None if self.ssl_cert == "default" else self.ssl_cert
+            ssl_context = ssl.create_default_context(cafile=cafile)
+            ssl_context.verify_mode = ssl.CERT_REQUIRED
+            self._ssl_contexts[self.ssl_cert] = ssl_context
+        return ssl_context
+
+    def _wrap_ssl(self, sock, **kwargs):
+        # session of previous connection to the same server is offered for resumption (python 3.6+)
+        if self._ssl_session is not None and self._ssl_session[0] == self.server:
+            kwargs['session'] = self._ssl_session[1]
+        return self._get_ssl_context().wrap_socket(sock, server_hostname=self.server, **kwargs)
+
+    def _ssl_established(self):
+        self.ssl_session_reused = getattr(self._socket, 'session_reused', False)
+        self._log(LOG_INFO, 'TLS session reused' if self.ssl_session_reused else 'TLS full handshake')
+        self._save_ssl_session()
+
+    def _save_ssl_session(self):
+        # with TLS 1.3 session ticket is received after handshake so session is saved again before socket close
+        session = getattr(self._socket, 'session', None)
+        if session is not None:
+            self._ssl_session = (self.server, session)
+
+    def _resolve(self):
+        # resolved addresses are cached for DNS_TTL. Expired entry is still used if DNS lookup fails
+        key = (self.server, self.port)
+        cached = self._dns_cache.get(key)
+        if cached is not None and cached[0] > ticks_ms():
+            return cached[1]
+        try:
+            # AI_ADDRCONFIG skips address families not configured on host, ex. IPv6 on embedded kernels
+            addr_info = socket.getaddrinfo(self.server, self.port, 0, socket.SOCK_STREAM, 0,
+                                           getattr(socket, 'AI_ADDRCONFIG', 0))
+        except (IOError, OSError) as err:
+            if cached is None:
+                raise
+            self._log(LOG_WARNING, 'DNS lookup failed: {}. Using cached addresses', err)
+            return cached[1]
+        # address families are interleaved so connect attempts alternate between IPv6 and IPv4
+        by_family = OrderedDict()
+        for family, _, _, _, sock_addr in addr_info:
+            if (family, sock_addr) not in by_family.setdefault(family, []):
+                by_family[family].append((family, sock_addr))
+        addrs = []
+        for idx in range(max(len(group) for group in by_family.values()) if by_family else 0):
+            addrs.extend(group[idx] for group in by_family.values() if idx < len(group))
+        if not addrs:
+            raise BlynkError('No addresses found for {}'.format(self.server))
+        self._dns_cache[key] = (ticks_ms() + self.DNS_TTL * 1000, addrs)
+        return addrs
+
+    def _tune_socket(self, sock):
+        options = []
+        if self.TCP_NODELAY:
+            options.append((socket.IPPROTO_TCP, 'TCP_NODELAY', 1))
+        if self.TCP_KEEPALIVE:
+            idle, interval, count = self.TCP_KEEPALIVE
+            options.append((socket.SOL_SOCKET, 'SO_KEEPALIVE', 1))
+            # option names differ between platforms. macOS uses TCP_KEEPALIVE for idle time
+            for opt_name, value in (('TCP_KEEPIDLE', idle), ('TCP_KEEPALIVE', idle),
+                                    ('TCP_KEEPINTVL', interval), ('TCP_KEEPCNT', count)):
+                if hasattr(socket, opt_name):
+                    options.append((socket.IPPROTO_TCP, opt_name, value))
+        if self.SOCK_RCVBUF:
+            options.append((socket.SOL_SOCKET, 'SO_RCVBUF', self.SOCK_RCVBUF))
+        if self.SOCK_SNDBUF:
+            options.append((socket.SOL_SOCKET, 'SO_SNDBUF', self.SOCK_SNDBUF))
+        # options are applied one by one, so option not supported by platform does not skip the rest
+        for level, opt_name, value in options:
+            try:
+                sock.setsockopt(level, getattr(socket, opt_name), value)
+            except (IOError, OSError) as err:
+                self._log(LOG_DEBUG, 'Socket option {} not applied: {}', opt_name, err)
+
+    def _open_socket(self, addrs):
+        # happy eyeballs: connection to next address is started if previous attempts are not finished
+        # in CONNECT_STAGGER ms or failed. The first established connection is used
+        pending = {}
+        errors = []
+        idx = 0
+        next_start = 0
+        end_time = time.time() + self.SOCK_MAX_TIMEOUT
+        try:
+            while True:
+                now = time.time()
+                if idx < len(addrs) and (now >= next_start or not pending):
+                    family, sock_addr = addrs[idx]
+                    idx += 1
+                    sock = None
+                    try:
+                        sock = socket.socket(family, socket.SOCK_STREAM)
+                        self._tune_socket(sock)
+                        sock.setblocking(False)
+                        err = sock.connect_ex(sock_addr)
+                    except (IOError, OSError) as s_err:
+                        # ex. IPv6 address on host without IPv6 support. Next address is tried at once
+                        errors.append('{}: {}'.format(sock_addr[0], s_err))
+                        if sock is not None:
+                            sock.close()
+                        continue
+                    if err == 0:
+                        return sock
+                    if err in (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EAGAIN, getattr(errno, 'WSAEWOULDBLOCK', 0)):
+                        pending[sock] = sock_addr
+                        next_start = now + self.CONNECT_STAGGER / 1000.0
+                    else:
+                        errors.append('{}: {}'.format(sock_addr[0], os.strerror(err)))
+                        sock.close()
+                    continue
+                if not pending or now >= end_time:
+                    break
+                wait_end = next_start if idx < len(addrs) else end_time
+                _, writable, _ = select.select([], list(pending), [], max(0, min(wait_end, end_time) - now))
+                for sock in writable:
+                    sock_addr = pending.pop(sock)
+                    err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                    if err == 0:
+                        return sock
+                    errors.append('{}: {}'.format(sock_addr[0], os.strerror(err)))
+                    sock.close()
+                    next_start = 0
+            raise BlynkError(', '.join(errors) or 'timed out')
+        finally:
+            for sock in pending:
+                sock.close()
+
     def _get_socket(self):
         try:
             self._state = self.CONNECTING
-            self._socket = socket.socket()
-            self._socket.connect(socket.getaddrinfo(self.server, self.port)[0][4])
+            self._rx_buffer = bytearray()
+            self._socket = self._open_socket(self._resolve())
+            self._socket.setblocking(True)
             self._socket.settimeout(self.SOCK_TIMEOUT)
             if self.ssl_cert:
-                # system default CA certificates case
-                if self.ssl_cert == "default":
-                    self.ssl_cert = None
-                self.log('Using SSL socket...')
-                ssl_context = ssl.create_default_context(cafile=self.ssl_cert)
-                ssl_context.verify_mode = ssl.CERT_REQUIRED
+                self._log(LOG_INFO, 'Using SSL socket...')
                 self._socket.settimeout(self.SOCK_SSL_TIMEOUT)
-                self._socket = ssl_context.wrap_socket(sock=self._socket, server_hostname=self.server)
-            self.log('Connected to blynk server')
+                self._socket = self._wrap_ssl(self._socket)
+                self._ssl_established()
+            # socket is switched to non-blocking mode once: writes never wait and reads wait with select
+            self._socket.setblocking(False)
+            self._log(LOG_INFO, 'Connected to blynk server')
         except Exception as g_exc:
             raise BlynkError('Connection with the Blynk server failed: {}'.format(g_exc))
 
     def _authenticate(self):
-        self.log('Authenticating device...')
+        self._log(LOG_INFO, 'Authenticating device...')
         self._state = self.AUTHENTICATING
         self.send(self.login_msg(self.token))
         rsp_data = self.receive(self.rcv_buffer, self.SOCK_MAX_TIMEOUT)
         if not rsp_data:
             raise BlynkError('Auth stage timeout')
         msg_type, _, status, args = self.parse_response(rsp_data, self.rcv_buffer)
+        self._check_auth_response(msg_type, status, args)
+
+    def _check_auth_response(self, msg_type, status, args):
         if status != self.STATUS_OK:
             if status == self.STATUS_INVALID_TOKEN:
                 raise BlynkError('Invalid Auth Token')
@@ -229,7 +742,7 @@ class Connection(Protocol):
                 raise RedirectError(*args)
             raise BlynkError('Auth stage failed. Status={}'.format(status))
         self._state = self.AUTHENTICATED
-        self.log('Access granted')
+        self._log(LOG_INFO, 'Access granted')
 
     def _set_heartbeat(self):
         self.send(self.heartbeat_msg(self.heartbeat, self.rcv_buffer))
@@ -237,9 +750,14 @@ class Connection(Protocol):
         if not rcv_data:
             raise BlynkError('Heartbeat stage timeout')
         _, _, status, _ = self.parse_response(rcv_data, self.rcv_buffer)
+        self._check_heartbeat_response(status)
+        # messages sent by server right after heartbeat response are processed by regular read flow
+        self._rx_buffer = bytearray(rcv_data[self.frame_len(rcv_data):])
+
+    def _check_heartbeat_response(self, status):
         if status != self.STATUS_OK:
             raise BlynkError('Set heartbeat returned code={}'.format(status))
-        self.log('Heartbeat = {} sec. MaxCmdBuffer = {} bytes'.format(self.heartbeat, self.rcv_buffer))
+        self._log(LOG_INFO, 'Heartbeat = {} sec. MaxCmdBuffer = {} bytes', self.heartbeat, self.rcv_buffer)
 
     def connected(self):
         return True if self._state == self.AUTHENTICATED else False
@@ -255,127 +773,375 @@ class Blynk(Connection):
     _DISCONNECT = 'disconnect'
     _VPIN_READ_ALL = '{}{}'.format(_VPIN_READ, _VPIN_WILDCARD)
     _VPIN_WRITE_ALL = '{}{}'.format(_VPIN_WRITE, _VPIN_WILDCARD)
-    _events = {}
+    _LOGO = LOGO
+    EXECUTOR_WORKERS = 4
+    # with profile=True handler call taking longer than SLOW_HANDLER_MS is logged as warning
+    SLOW_HANDLER_MS = 100
 
     def __init__(self, token, **kwargs):
+        # with reconnect_nonblocking=True run() does not wait for next reconnect attempt and returns at once
+        self.reconnect_nonblocking = kwargs.pop('reconnect_nonblocking', False)
+        # handler name -> [calls, total ms, max ms]
+        self._profile = {} if kwargs.pop('profile', False) else None
         Connection.__init__(self, token, **kwargs)
+        self._events = {}
+        self._read_handlers = [None] * (self.VPIN_MAX_NUM + 1)
+        self._write_handlers = [None] * (self.VPIN_MAX_NUM + 1)
+        self._internal_handlers = {}
+        self._read_all_handler = None
+        self._write_all_handler = None
+        self._blocking_handlers = set()
+        self._executor = None
+        self._jobs = set()
         self._start_time = ticks_ms()
         self._last_rcv_time = ticks_ms()
         self._last_send_time = ticks_ms()
         self._last_ping_time = ticks_ms()
         self._state = self.DISCONNECTED
-        print(LOGO)
+        if self._LOGO:
+            print(self._LOGO)
 
     def connect(self, timeout=_CONNECT_TIMEOUT):
         end_time = time.time() + timeout
         while not self.connected():
             if self._state == self.DISCONNECTED:
+                # next attempt waits for backoff delay but connect timeout is not exceeded
+                wait_ms = self._reconnect_at - ticks_ms()
+                if wait_ms > 0:
+                    left_ms = (end_time - time.time()) * 1000
+                    sleep_ms(max(0, min(wait_ms, left_ms)))
+                    if wait_ms > left_ms:
+                        return False
                 try:
                     self._get_socket()
                     self._authenticate()
                     self._set_heartbeat()
                     self._last_rcv_time = ticks_ms()
-                    self.log('Registered events: {}\n'.format(list(self._events.keys())))
+                    self._log(LOG_INFO, 'Registered events: {}\n', list(self._events.keys()))
+                    self._reconnect_attempt = 0
+                    self._connected_metrics()
                     self.call_handler(self._CONNECT)
+                    if self._rx_buffer:
+                        self.feed(b'')
                     return True
                 except BlynkError as b_err:
+                    if self.metrics is not None:
+                        self.metrics.inc('blynk_connect_failures_total')
                     self.disconnect(b_err)
-                    sleep_ms(self.TASK_PERIOD_RES)
                 except RedirectError as r_err:
                     self.disconnect()
                     self.server = r_err.server
                     self.port = r_err.port
-                    sleep_ms(self.TASK_PERIOD_RES)
+                    # redirected server is connected without delay
+                    self._reconnect_at = 0
+            else:
+                sleep_ms(self.TASK_PERIOD_RES)
             if time.time() >= end_time:
                 return False
 
     def disconnect(self, err_msg=None):
+        # next connect attempt is delayed by backoff. Delay is waited by connect() or run() loop
+        self._close_connection(err_msg)
+        self._schedule_reconnect()
+
+    def _connected_metrics(self):
+        if self.metrics is not None:
+            self.metrics.inc('blynk_connects_total')
+            self.metrics.set('blynk_connected', 1)
+
+    def _close_connection(self, err_msg=None):
+        if self.metrics is not None:
+            self.metrics.inc('blynk_disconnects_total')
+            self.metrics.set('blynk_connected', 0)
         self.call_handler(self._DISCONNECT)
         if self._socket:
+            if self.ssl_cert:
+                self._save_ssl_session()
             self._socket.close()
         self._state = self.DISCONNECTED
+        self._rx_buffer = bytearray()
+        self._tx_buffer = bytearray()
+        self._rtt_pending.clear()
+        self._store_unsent()
         if err_msg:
-            self.log('[ERROR]: {}\nConnection closed'.format(err_msg))
+            self._log(LOG_ERROR, '[ERROR]: {}\nConnection closed', err_msg)
         self._msg_id = 0
-        time.sleep(self.RECONNECT_SLEEP)
+
+    def _store_unsent(self):
+        # messages that were not written to socket are moved to offline store if it is used
+        if self.offline_store is not None:
+            # pending messages are older than stored ones: new messages are stored while replay is in progress.
+            # They are returned to store head in reverse order to be replayed first
+            for msg in reversed(list(self._tx_pending.values())):
+                self.offline_store.put_front(msg)
+            for _, msg in self._tx_queue:
+                self.offline_store.put(msg)
+        self._tx_queue.clear()
+        self._tx_pending.clear()
 
     def virtual_write(self, v_pin, *val):
-        return self.send(self.virtual_write_msg(v_pin, *val))
+        return self._send_limited(self.virtual_write_msg(v_pin, *val), ('vw', str(v_pin)))
+
+    def virtual_write_many(self, pin_values):
+        # pin_values: dict or iterable of (pin, value) pairs. List or tuple value is sent as multiple values
+        # returns number of accepted bytes of all messages like virtual_write, or None/0 if sending failed
+        pairs = pin_values.items() if hasattr(pin_values, 'items') else pin_values
+        if self.rate_limit is not None:
+            # every pin write passes rate limiter separately to be coalesced with other writes of this pin.
+            # Messages allowed right away are still sent with single sendall call
+            accepted = 0
+            with self.batch():
+                for v_pin, val in pairs:
+                    result = self.virtual_write(v_pin, *(val if isinstance(val, (list, tuple)) else (val,)))
+                    if not result:
+                        return result
+                    accepted += result
+            return accepted
+        msgs = bytearray()
+        for v_pin, val in pairs:
+            if not isinstance(val, (list, tuple)):
+                val = (val,)
+            self._pack_into(msgs, self.MSG_HW, 'vw', v_pin, *val)
+        if msgs:
+            return self.send_all(msgs)
+        return 0
 
     def virtual_sync(self, *v_pin):
-        return self.send(self.virtual_sync_msg(*v_pin))
+        return self._send_limited(self.virtual_sync_msg(*v_pin))
 
     def email(self, to, subject, body):
-        return self.send(self.email_msg(to, subject, body))
+        return self._send_limited(self.email_msg(to, subject, body))
 
     def tweet(self, msg):
-        return self.send(self.tweet_msg(msg))
+        return self._send_limited(self.tweet_msg(msg))
 
     def notify(self, msg):
-        return self.send(self.notify_msg(msg))
+        return self._send_limited(self.notify_msg(msg))
 
     def set_property(self, v_pin, property_name, *val):
-        return self.send(self.set_property_msg(v_pin, property_name, *val))
+        return self._send_limited(self.set_property_msg(v_pin, property_name, *val),
+                                  ('prop', str(v_pin), property_name))
 
     def internal(self, *args):
-        return self.send(self.internal_msg(*args))
+        return self._send_limited(self.internal_msg(*args))
 
-    def handle_event(blynk, event_name):
+    def handle_event(blynk, event_name, blocking=False):
+        # blocking=True runs handler in thread pool so slow handler does not stop socket reading
         class Deco(object):
             def __init__(self, func):
                 self.func = func
-                # wildcard 'read V*' and 'write V*' events handling
-                if str(event_name).lower() in (blynk._VPIN_READ_ALL, blynk._VPIN_WRITE_ALL):
-                    event_base_name = str(event_name).split(blynk._VPIN_WILDCARD)[0]
-                    for i in range(blynk.VPIN_MAX_NUM + 1):
-                        blynk._events['{}{}'.format(event_base_name.lower(), i)] = func
-                else:
-                    blynk._events[str(event_name).lower()] = func
+                blynk._register_handler(str(event_name).lower(), func, blocking)
 
             def __call__(self):
                 return self.func()
 
         return Deco
 
+    def _register_handler(self, event, func, blocking=False):
+        # pin and internal events are additionally stored in per instance dispatch tables
+        # so incoming messages are routed by pin number or internal command without event name building
+        # wildcard 'read V*' and 'write V*' handlers are used as fallback for pins without own handler
+        if blocking:
+            if ThreadPoolExecutor is None:
+                raise BlynkError('Blocking handlers require concurrent.futures module')
+            self._blocking_handlers.add(func)
+        self._events[event] = func
+        if event == self._VPIN_READ_ALL:
+            self._read_all_handler = func
+        elif event == self._VPIN_WRITE_ALL:
+            self._write_all_handler = func
+        elif event.startswith(self._INTERNAL):
+            self._internal_handlers[event[len(self._INTERNAL):]] = func
+        for event_base_name, handlers in ((self._VPIN_READ, self._read_handlers),
+                                          (self._VPIN_WRITE, self._write_handlers)):
+            if event.startswith(event_base_name) and event[len(event_base_name):].isdigit():
+                pin = int(event[len(event_base_name):])
+                if pin <= self.VPIN_MAX_NUM:
+                    handlers[pin] = func
+
     def call_handler(self, event, *args, **kwargs):
-        if event in self._events.keys():
-            self.log("Event: ['{}'] -> {}".format(event, args))
-            self._events[event](*args, **kwargs)
+        handler = self._events.get(event)
+        if handler is None:
+            if event.startswith(self._VPIN_WRITE):
+                handler = self._write_all_handler
+            elif event.startswith(self._VPIN_READ):
+                handler = self._read_all_handler
+        if handler is not None:
+            return self._run_handler(handler, event, None, *args, **kwargs)
+
+    def _run_handler(self, handler, event, pin, *args, **kwargs):
+        self._log(LOG_DEBUG, "Event: ['{}{}'] -> {}", event, '' if pin is None else pin, args)
+        blocking = self._blocking_handlers and handler in self._blocking_handlers
+        if self.metrics is not None or self._profile is not None:
+            if self.metrics is not None:
+                self.metrics.inc('blynk_events_total')
+            args = (handler, event, pin) + args
+            handler = self._measure_handler
+        if blocking:
+            return self._submit(handler, *args, **kwargs)
+        return handler(*args, **kwargs)
+
+    def _measure_handler(self, handler, event, pin, *args, **kwargs):
+        start_time = time.time()
+        try:
+            return handler(*args, **kwargs)
+        except Exception:
+            if self.metrics is not None:
+                self.metrics.inc('blynk_handler_errors_total')
+            raise
+        finally:
+            elapsed = time.time() - start_time
+            if self.metrics is not None:
+                self.metrics.observe('blynk_handler_seconds', elapsed)
+            if self._profile is not None:
+                self._profile_call(event if pin is None else '{}{}'.format(event, pin), elapsed * 1000)
+
+    def _profile_call(self, name, elapsed_ms):
+        stats = self._profile.get(name)
+        if stats is None:
+            stats = self._profile[name] = [0, 0.0, 0.0]
+        stats[0] += 1
+        stats[1] += elapsed_ms
+        stats[2] = max(stats[2], elapsed_ms)
+        if elapsed_ms > self.SLOW_HANDLER_MS:
+            self._log(LOG_WARNING, '[WARNING] Slow handler: [\'{}\'] took {:.1f} ms', name, elapsed_ms)
+
+    def profile_stats(self):
+        """returns list of (event name, calls, total ms, max ms) sorted by total time"""
+        if self._profile is None:
+            return []
+        stats = [(name,) + tuple(values) for name, values in self._profile.items()]
+        return sorted(stats, key=lambda item: item[2], reverse=True)
+
+    def log_profile(self, timer=None):
+        """logs handlers profile and profile of timer if it is given"""
+        reports = [('Handler', self.profile_stats())]
+        if timer is not None:
+            reports.append(('Timer', timer.profile_stats()))
+        for kind, stats in reports:
+            self.log('{:<24} {:>8} {:>12} {:>10}'.format(kind, 'calls', 'total ms', 'max ms'))
+            for name, calls, total_ms, max_ms in stats:
+                self.log('{:<24} {:>8} {:>12.1f} {:>10.1f}'.format(name, calls, total_ms, max_ms))
+
+    def _submit(self, func, *args, **kwargs):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.EXECUTOR_WORKERS)
+        job = self._executor.submit(func, *args, **kwargs)
+        self._jobs.add(job)
+        job.add_done_callback(self._job_done)
+        return job
+
+    def _job_done(self, job):
+        self._jobs.discard(job)
+        if not job.cancelled() and job.exception() is not None:
+            self._log(LOG_ERROR, 'Event handler error: {}', job.exception())
 
     def process(self, msg_type, msg_id, msg_len, msg_args):
         if msg_type == self.MSG_RSP:
-            self.log('Response status: {}'.format(msg_len))
+            self._log(LOG_DEBUG, 'Response status: {}', msg_len)
+            if self._rtt_pending:
+                self._rtt_response(msg_id)
         elif msg_type == self.MSG_PING:
             self.send(self.response_msg(self.STATUS_OK, msg_id=msg_id))
         elif msg_type in (self.MSG_HW, self.MSG_BRIDGE, self.MSG_INTERNAL):
             if msg_type == self.MSG_INTERNAL:
-                self.call_handler("{}{}".format(self._INTERNAL, msg_args[0]), msg_args[1:])
+                handler = self._internal_handlers.get(msg_args[0])
+                if handler is not None:
+                    self._run_handler(handler, self._INTERNAL, msg_args[0], msg_args[1:])
             elif len(msg_args) >= 3 and msg_args[0] == 'vw':
-                self.call_handler("{}{}".format(self._VPIN_WRITE, msg_args[1]), int(msg_args[1]), msg_args[2:])
+                pin = int(msg_args[1])
+                handler = self._write_handlers[pin] if 0 <= pin <= self.VPIN_MAX_NUM else None
+                if handler is None:
+                    handler = self._write_all_handler
+                if handler is not None:
+                    self._run_handler(handler, self._VPIN_WRITE, pin, pin, msg_args[2:])
             elif len(msg_args) == 2 and msg_args[0] == 'vr':
-                self.call_handler("{}{}".format(self._VPIN_READ, msg_args[1]), int(msg_args[1]))
+                pin = int(msg_args[1])
+                handler = self._read_handlers[pin] if 0 <= pin <= self.VPIN_MAX_NUM else None
+                if handler is None:
+                    handler = self._read_all_handler
+                if handler is not None:
+                    self._run_handler(handler, self._VPIN_READ, pin, pin)
 
     def read_response(self, timeout=0.5):
         end_time = time.time() + timeout
         while time.time() <= end_time:
+            if self._tx_buffer:
+                self._flush_socket()
             rsp_data = self.receive(self.rcv_buffer, self.SOCK_TIMEOUT)
             if rsp_data:
                 self._last_rcv_time = ticks_ms()
-                msg_type, msg_id, h_data, msg_args = self.parse_response(rsp_data, self.rcv_buffer)
+                self.feed(rsp_data)
+
+    def feed(self, rsp_data):
+        # frames are already removed from rx buffer, so error of one frame is logged and the rest are processed
+        for msg_type, msg_id, h_data, msg_args in self.read_frames(rsp_data):
+            try:
                 self.process(msg_type, msg_id, h_data, msg_args)
+            except Exception as p_err:
+                self._log(LOG_ERROR, 'Message processing error: {}', p_err)
+
+    def wait_response(self, timeout):
+        # waits for incoming data no longer than timeout and processes it. No fixed polling intervals are used
+        # ssl socket may keep already decrypted data which is not signaled by select
+        # buffered outgoing data is written when socket becomes writable
+        if not (getattr(self._socket, 'pending', None) and self._socket.pending()):
+            readable, writable, _ = select.select([self._socket], [self._socket] if self._tx_buffer else [], [],
+                                                  timeout)
+            if writable:
+                self._flush_socket()
+            if not readable:
+                return
+        rsp_data = self.receive(self.rcv_buffer, 0)
+        if rsp_data:
+            self._last_rcv_time = ticks_ms()
+            self.feed(rsp_data)
 
-    def run(self):
+    def _loop_timeout(self, timer):
+        # server liveness check in is_server_alive has heartbeat/10 resolution
+        timeout = self.heartbeat / 10.0
+        timer_timeout = timer.next_timeout()
+        if timer_timeout is not None and timer_timeout < timeout:
+            timeout = timer_timeout
+        # data queued by running thread pool jobs should not wait for the whole loop period
+        if (self._jobs or timer.running_jobs()) and self.SOCK_TIMEOUT < timeout:
+            timeout = self.SOCK_TIMEOUT
+        tx_delay = self.tx_delay()
+        if tx_delay is not None and tx_delay < timeout:
+            timeout = tx_delay
+        return timeout
+
+    def run(self, timer=None):
+        # with blynktimer.Timer instance passed single wait serves both socket events and timers deadlines
+        self._io_thread_id = get_ident()
         if not self.connected():
-            self.connect()
+            wait_ms = self._reconnect_at - ticks_ms()
+            if not self.reconnect_nonblocking:
+                self.connect()
+            elif wait_ms <= 0:
+                self.connect(timeout=0)
+            elif timer is not None:
+                # timers are served while reconnect attempt is waited
+                sleep_ms(min(wait_ms, self._loop_timeout(timer) * 1000))
+            else:
+                # short wait like socket read of connected loop, so caller loop does not spin
+                sleep_ms(min(wait_ms, self.SOCK_TIMEOUT * 1000))
         else:
             try:
-                self.read_response(timeout=self.SOCK_TIMEOUT)
+                if self._tx_queue or self._tx_pending or self.offline_store:
+                    self.flush_tx_queue()
+                if timer is None:
+                    self.read_response(timeout=self.SOCK_TIMEOUT)
+                else:
+                    self.wait_response(self._loop_timeout(timer))
                 if not self.is_server_alive():
                     self.disconnect('Blynk server is offline')
             except KeyboardInterrupt:
                 raise
             except BlynkError as b_err:
-                self.log(b_err)
+                self._log(LOG_ERROR, '{}', b_err)
                 self.disconnect()
             except Exception as g_exc:
-                self.log(g_exc)
+                self._log(LOG_ERROR, '{}', g_exc)
+        if timer is not None:
+            timer.fire()
@@ -0,0 +1,226 @@
+# Copyright (c) 2019-2020 Anton Morozenko
+# See the file LICENSE for copying permission.
+"""
+Asyncio Blynk client. Requires Python 3.5+
+Uses the same Protocol framing and event handlers as blynklib.Blynk but awaits socket reads instead of polling.
+Handlers registered with handle_event may be plain functions or 'async def' coroutines.
+"""
+import asyncio
+
+from blynklib import Blynk, BlynkError, RedirectError, LOG_ERROR, LOG_INFO, get_ident, ticks_ms
+
+
+class AsyncBlynk(Blynk):
+    def __init__(self, token, **kwargs):
+        Blynk.__init__(self, token, **kwargs)
+        self._reader = None
+        self._writer = None
+        self._heartbeat_task = None
+        self._tasks = set()
+        self._loop = None
+        self._flush_handle = None
+
+    def send(self, data):
+        if self._batch is not None:
+            self._batch += data
+            return len(data)
+        if self._off_io_thread():
+            # handlers registered with blocking=True run in thread pool. Writer is served by event loop thread only
+            self._loop.call_soon_threadsafe(self.send, data)
+            return len(data)
+        if self._writer is None:
+            return None
+        self._last_send_time = ticks_ms()
+        # transport buffers outgoing data. Backpressure is handled by drain() call in run loop
+        self._writer.write(data)
+        if self.metrics is not None:
+            self.metrics.inc('blynk_tx_bytes_total', len(data))
+            self.metrics.set('blynk_tx_buffered_bytes', self._writer.transport.get_write_buffer_size())
+        return len(data)
+
+    def send_all(self, data):
+        return self.send(data)
+
+    def _send_limited(self, data, key=None):
+        if self._off_io_thread():
+            if self._batch is not None:
+                return self.send(data)
+            self._loop.call_soon_threadsafe(self._send_limited, data, key)
+            return len(data)
+        result = Blynk._send_limited(self, data, key)
+        self._schedule_flush()
+        return result
+
+    def _schedule_flush(self):
+        # pending messages are sent by event loop callback when rate limit allows
+        if self._flush_handle is None and self._loop is not None:
+            delay = self.tx_delay()
+            if delay is not None:
+                self._flush_handle = self._loop.call_later(delay, self._flush_pending)
+
+    def _flush_pending(self):
+        self._flush_handle = None
+        self.flush_tx_queue()
+        self._schedule_flush()
+
+    def _run_handler(self, handler, event, pin, *args, **kwargs):
+        result = Blynk._run_handler(self, handler, event, pin, *args, **kwargs)
+        if asyncio.iscoroutine(result):
+            task = asyncio.ensure_future(result)
+            self._tasks.add(task)
+            task.add_done_callback(self._handler_done)
+        return result
+
+    def _handler_done(self, task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self._log(LOG_ERROR, 'Event handler error: {}', task.exception())
+
+    async def _read_message(self, timeout):
+        rsp_data = await asyncio.wait_for(self._reader.readexactly(self.MSG_HEAD_LEN), timeout)
+        msg_len = self.frame_len(rsp_data)
+        if msg_len > self.MSG_HEAD_LEN:
+            rsp_data += await asyncio.wait_for(self._reader.readexactly(msg_len - self.MSG_HEAD_LEN), timeout)
+        return self.parse_response(rsp_data, self.rcv_buffer)
+
+    async def _get_socket(self):
+        try:
+            self._state = self.CONNECTING
+            self._rx_buffer = bytearray()
+            ssl_context = None
+            if self.ssl_cert:
+                self._log(LOG_INFO, 'Using SSL socket...')
+                ssl_context = self._get_ssl_context()
+            self._reader, self._writer = await asyncio.wait_for(
+                asyncio.open_connection(self.server, self.port, ssl=ssl_context,
+                                        server_hostname=self.server if ssl_context else None),
+                self.SOCK_MAX_TIMEOUT)
+            # asyncio connects socket itself, so options are applied right after connect
+            sock = self._writer.get_extra_info('socket')
+            if sock is not None:
+                self._tune_socket(sock)
+            self._log(LOG_INFO, 'Connected to blynk server')
+        except Exception as g_exc:
+            raise BlynkError('Connection with the Blynk server failed: {}'.format(g_exc))
+
+    async def _authenticate(self):
+        self._log(LOG_INFO, 'Authenticating device...')
+        self._state = self.AUTHENTICATING
+        self.send(self.login_msg(self.token))
+        try:
+            msg_type, _, status, args = await self._read_message(self.SOCK_MAX_TIMEOUT)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError):
+            raise BlynkError('Auth stage timeout')
+        self._check_auth_response(msg_type, status, args)
+
+    async def _set_heartbeat(self):
+        self.send(self.heartbeat_msg(self.heartbeat, self.rcv_buffer))
+        try:
+            _, _, status, _ = await self._read_message(self.SOCK_MAX_TIMEOUT)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError):
+            raise BlynkError('Heartbeat stage timeout')
+        self._check_heartbeat_response(status)
+
+    async def connect(self, timeout=Blynk._CONNECT_TIMEOUT):
+        loop = self._loop = asyncio.get_event_loop()
+        self._io_thread_id = get_ident()
+        end_time = loop.time() + timeout
+        while not self.connected():
+            # next attempt waits for backoff delay but connect timeout is not exceeded
+            wait = (self._reconnect_at - ticks_ms()) / 1000.0
+            if wait > 0:
+                left = end_time - loop.time()
+                await asyncio.sleep(max(0, min(wait, left)))
+                if wait > left:
+                    return False
+            try:
+                await self._get_socket()
+                await self._authenticate()
+                await self._set_heartbeat()
+                self._last_rcv_time = ticks_ms()
+                self._reconnect_attempt = 0
+                self._connected_metrics()
+                self._log(LOG_INFO, 'Registered events: {}\n', list(self._events.keys()))
+                self._heartbeat_task = asyncio.ensure_future(self._heartbeat_loop())
+                self.call_handler(self._CONNECT)
+                self._schedule_flush()
+                return True
+            except BlynkError as b_err:
+                if self.metrics is not None:
+                    self.metrics.inc('blynk_connect_failures_total')
+                self.disconnect(b_err)
+            except RedirectError as r_err:
+                self.disconnect()
+                self.server = r_err.server
+                self.port = r_err.port
+                self._reconnect_at = 0
+            if loop.time() >= end_time:
+                return False
+        return True
+
+    def _close_connection(self, err_msg=None):
+        if self.metrics is not None:
+            self.metrics.inc('blynk_disconnects_total')
+            self.metrics.set('blynk_connected', 0)
+        self.call_handler(self._DISCONNECT)
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = None
+        self._writer = None
+        if self._heartbeat_task is not None and self._heartbeat_task is not _current_task():
+            self._heartbeat_task.cancel()
+        self._heartbeat_task = None
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        self._state = self.DISCONNECTED
+        self._rx_buffer = bytearray()
+        self._rtt_pending.clear()
+        self._store_unsent()
+        if err_msg:
+            self._log(LOG_ERROR, '[ERROR]: {}\nConnection closed', err_msg)
+        self._msg_id = 0
+
+    async def _heartbeat_loop(self):
+        # is_server_alive sends ping no more often than heartbeat/10 so it is checked with same period
+        while self.connected():
+            await asyncio.sleep(self.heartbeat / 10.0)
+            if self.connected() and not self.is_server_alive():
+                self.disconnect('Blynk server is offline')
+
+    async def run(self):
+        while True:
+            if not self.connected():
+                await self.connect()
+                continue
+            try:
+                rsp_data = await self._reader.read(self.rcv_buffer)
+                if self.metrics is not None:
+                    self.metrics.inc('blynk_rx_reads_total')
+                if not self.connected():
+                    continue
+                if not rsp_data:
+                    raise BlynkError('Connection closed by server')
+                self._last_rcv_time = ticks_ms()
+                self.feed(rsp_data)
+                await self._writer.drain()
+            except asyncio.CancelledError:
+                self.disconnect()
+                raise
+            except BlynkError as b_err:
+                self._log(LOG_ERROR, '{}', b_err)
+                self.disconnect()
+            except (IOError, OSError) as o_err:
+                self.disconnect(o_err)
+            except Exception as g_exc:
+                self._log(LOG_ERROR, '{}', g_exc)
+
+
+def _current_task():
+    try:
+        return asyncio.current_task()
+    except AttributeError:
+        # python < 3.7
+        return asyncio.Task.current_task()
+    except RuntimeError:
+        return None
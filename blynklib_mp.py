@@ -23,6 +23,13 @@ LOGO = """
             /___/ for Python v{}\n""".format(__version__)
 
 
+# log levels. Messages below level set by log_level are not formatted at all
+LOG_DEBUG = const(10)
+LOG_INFO = const(20)
+LOG_WARNING = const(30)
+LOG_ERROR = const(40)
+
+
 def stub_log(*args):
     pass
 
@@ -144,13 +151,20 @@ class Connection(Protocol):
     _last_ping_time = 0
     _last_send_time = 0
 
-    def __init__(self, token, server='blynk-cloud.com', port=80, heartbeat=10, rcv_buffer=1024, log=stub_log):
+    def __init__(self, token, server='blynk-cloud.com', port=80, heartbeat=10, rcv_buffer=1024, log=stub_log,
+                 log_level=LOG_DEBUG):
         self.token = token
         self.server = server
         self.port = port
         self.heartbeat = heartbeat
         self.rcv_buffer = rcv_buffer
         self.log = log
+        self.log_level = log_level
+
+    def _log(self, level, msg, *args):
+        # message is formatted only if it is logged, so disabled logging costs no string building on hot paths
+        if self.log is not stub_log and level >= self.log_level:
+            self.log(msg.format(*args) if args else msg)
 
     def _set_socket_timeout(self, timeout):
         if getattr(self._socket, 'settimeout', None):
@@ -195,7 +209,7 @@ class Connection(Protocol):
             return False
         if (ping_delta > h_beat_ms // const(10)) and (send_delta > h_beat_ms or rcv_delta > h_beat_ms):
             self.send(self.ping_msg())
-            self.log('Heartbeat time: {}'.format(now))
+            self._log(LOG_DEBUG, 'Heartbeat time: {}', now)
             self._last_ping_time = now
         return True
 
@@ -205,12 +219,12 @@ class Connection(Protocol):
             self._socket = socket.socket()
             self._socket.connect(socket.getaddrinfo(self.server, self.port)[0][-1])
             self._set_socket_timeout(self.SOCK_TIMEOUT)
-            self.log('Connected to server')
+            self._log(LOG_INFO, 'Connected to server')
         except Exception as g_exc:
             raise BlynkError('Server connection failed: {}'.format(g_exc))
 
     def _authenticate(self):
-        self.log('Authenticating device...')
+        self._log(LOG_INFO, 'Authenticating device...')
         self._state = self.AUTHENTICATING
         self.send(self.login_msg(self.token))
         rsp_data = self.receive(self.rcv_buffer, self.SOCK_MAX_TIMEOUT)
@@ -224,7 +238,7 @@ class Connection(Protocol):
                 raise RedirectError(*args)
             raise BlynkError('Auth stage failed. Status={}'.format(status))
         self._state = self.AUTHENTICATED
-        self.log('Access granted')
+        self._log(LOG_INFO, 'Access granted')
 
     def _set_heartbeat(self):
         self.send(self.heartbeat_msg(self.heartbeat, self.rcv_buffer))
@@ -234,7 +248,7 @@ class Connection(Protocol):
         _, _, status, _, _ = self.parse_response(rcv_data, self.rcv_buffer)
         if status != self.STATUS_OK:
             raise BlynkError('Set heartbeat returned code={}'.format(status))
-        self.log('Heartbeat = {} sec. MaxCmdBuffer = {} bytes'.format(self.heartbeat, self.rcv_buffer))
+        self._log(LOG_INFO, 'Heartbeat = {} sec. MaxCmdBuffer = {} bytes', self.heartbeat, self.rcv_buffer)
 
     def connected(self):
         return True if self._state == self.AUTHENTICATED else False
@@ -270,7 +284,7 @@ class Blynk(Connection):
                     self._authenticate()
                     self._set_heartbeat()
                     self._last_rcv_time = ticks_ms()
-                    self.log('Registered events: {}\n'.format(list(self._events.keys())))
+                    self._log(LOG_INFO, 'Registered events: {}\n', list(self._events.keys()))
                     self.call_handler(self._CONNECT)
                     return True
                 except BlynkError as b_err:
@@ -290,7 +304,7 @@ class Blynk(Connection):
             self._socket.close()
         self._state = self.DISCONNECTED
         if err_msg:
-            self.log('[ERROR]: {}\nConnection closed'.format(err_msg))
+            self._log(LOG_ERROR, '[ERROR]: {}\nConnection closed', err_msg)
         time.sleep(self.RECONNECT_SLEEP)
 
     def virtual_write(self, v_pin, *val):
@@ -333,12 +347,12 @@ class Blynk(Connection):
 
     def call_handler(self, event, *args, **kwargs):
         if event in self._events.keys():
-            self.log("Event: ['{}'] -> {}".format(event, args))
+            self._log(LOG_DEBUG, "Event: ['{}'] -> {}", event, args)
             self._events[event](*args, **kwargs)
 
     def process(self, msg_type, msg_id, msg_len, msg_args):
         if msg_type == self.MSG_RSP:
-            self.log('Response status: {}'.format(msg_len))
+            self._log(LOG_DEBUG, 'Response status: {}', msg_len)
         elif msg_type == self.MSG_PING:
             self.send(self.response_msg(self.STATUS_OK, msg_id=msg_id))
         elif msg_type in (self.MSG_HW, self.MSG_BRIDGE, self.MSG_INTERNAL):
@@ -371,7 +385,7 @@ class Blynk(Connection):
             except KeyboardInterrupt:
                 raise
             except BlynkError as b_err:
-                self.log(b_err)
+                self._log(LOG_ERROR, '{}', b_err)
                 self.disconnect()
             except Exception as g_exc:
-                self.log(g_exc)
+                self._log(LOG_ERROR, '{}', g_exc)
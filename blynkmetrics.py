@@ -0,0 +1,186 @@
+# Copyright (c) 2019-2020 Anton Morozenko
+# See the file LICENSE for copying permission.
+"""
+Client side metrics for Blynk library.
+Registry keeps counters, gauges and fixed bucket histograms updated by Blynk connection and timers.
+Metrics can be exported in Prometheus text format to file or served by tiny local HTTP endpoint.
+"""
+import bisect
+import os
+import threading
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    # python2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+COUNTER = 'counter'
+GAUGE = 'gauge'
+HISTOGRAM = 'histogram'
+
+# seconds
+TIME_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# name, type, help, histogram buckets
+CLIENT_METRICS = (
+    ('blynk_tx_bytes_total', COUNTER, 'Bytes written to socket', None),
+    ('blynk_tx_frames_total', COUNTER, 'Messages built for sending', None),
+    ('blynk_tx_partial_writes_total', COUNTER, 'Socket writes that did not take whole outgoing buffer', None),
+    ('blynk_tx_errors_total', COUNTER, 'Socket write errors', None),
+    ('blynk_tx_buffered_bytes', GAUGE, 'Bytes waiting in outgoing buffer', None),
+    ('blynk_tx_coalesced_total', COUNTER, 'Pending messages replaced by newer value', None),
+    ('blynk_tx_stored_total', COUNTER, 'Messages put to offline store', None),
+    ('blynk_rx_reads_total', COUNTER, 'Socket receive calls', None),
+    ('blynk_rx_bytes_total', COUNTER, 'Bytes received from server', None),
+    ('blynk_rx_frames_total', COUNTER, 'Messages received from server', None),
+    ('blynk_rx_parse_errors_total', COUNTER, 'Received messages that could not be parsed', None),
+    ('blynk_connects_total', COUNTER, 'Successful connections', None),
+    ('blynk_connect_failures_total', COUNTER, 'Failed connection attempts', None),
+    ('blynk_disconnects_total', COUNTER, 'Closed connections', None),
+    ('blynk_connected', GAUGE, 'Connection state', None),
+    ('blynk_events_total', COUNTER, 'Event handler calls', None),
+    ('blynk_handler_errors_total', COUNTER, 'Event handler errors', None),
+    ('blynk_handler_seconds', HISTOGRAM, 'Event handler execution time', TIME_BUCKETS),
+    ('blynk_ping_rtt_seconds', HISTOGRAM, 'Ping round trip time', TIME_BUCKETS),
+    ('blynk_timer_runs_total', COUNTER, 'Timer function calls', None),
+    ('blynk_timer_seconds', HISTOGRAM, 'Timer function execution time', TIME_BUCKETS),
+    ('blynk_timer_lag_seconds', HISTOGRAM, 'Delay of timer run after its deadline', TIME_BUCKETS),
+)
+
+
+class Metric(object):
+    __slots__ = ('name', 'kind', 'help', 'value', 'buckets', 'counts', 'sum')
+
+    def __init__(self, name, kind, help_text, buckets=None):
+        self.name = name
+        self.kind = kind
+        self.help = help_text
+        self.value = 0
+        self.buckets = tuple(buckets) if buckets else None
+        # histogram counts are kept per bucket and accumulated on export. Last item is +Inf bucket
+        self.counts = [0] * (len(self.buckets) + 1) if buckets else None
+        self.sum = 0
+
+
+class Registry(object):
+    def __init__(self, labels=None, metrics=CLIENT_METRICS):
+        # labels are added to every metric of registry, ex. {'device': 'kitchen'} for gateway devices
+        self.labels = labels or {}
+        self._metrics = {}
+        for name, kind, help_text, buckets in metrics:
+            self.add(name, kind, help_text, buckets)
+
+    def add(self, name, kind, help_text, buckets=None):
+        if name not in self._metrics:
+            self._metrics[name] = Metric(name, kind, help_text, buckets)
+        return self._metrics[name]
+
+    def get(self, name):
+        return self._metrics[name]
+
+    def metrics(self):
+        return [self._metrics[name] for name in sorted(self._metrics)]
+
+    def inc(self, name, value=1):
+        self._metrics[name].value += value
+
+    def set(self, name, value):
+        self._metrics[name].value = value
+
+    def observe(self, name, value):
+        metric = self._metrics[name]
+        metric.counts[bisect.bisect_left(metric.buckets, value)] += 1
+        metric.sum += value
+        metric.value += 1
+
+    def exposition(self):
+        return exposition(self)
+
+
+def _format_labels(labels, extra=None):
+    items = sorted(labels.items()) + (extra or [])
+    if not items:
+        return ''
+    values = []
+    for key, value in items:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        values.append('{}="{}"'.format(key, value))
+    return '{' + ','.join(values) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def exposition(*registries):
+    """returns metrics of registries in Prometheus text format. Registries should differ by labels"""
+    families = {}
+    for registry in registries:
+        for metric in registry.metrics():
+            families.setdefault(metric.name, []).append((registry.labels, metric))
+    lines = []
+    for name in sorted(families):
+        first = families[name][0][1]
+        lines.append('# HELP {} {}'.format(name, first.help))
+        lines.append('# TYPE {} {}'.format(name, first.kind))
+        for labels, metric in families[name]:
+            if metric.kind != HISTOGRAM:
+                lines.append('{}{} {}'.format(name, _format_labels(labels), _format_value(metric.value)))
+                continue
+            cumulative = 0
+            for bound, count in zip(metric.buckets + ('+Inf',), metric.counts):
+                cumulative += count
+                lines.append('{}_bucket{} {}'.format(name, _format_labels(labels, [('le', bound)]), cumulative))
+            lines.append('{}_sum{} {}'.format(name, _format_labels(labels), _format_value(metric.sum)))
+            lines.append('{}_count{} {}'.format(name, _format_labels(labels), metric.value))
+    return '\n'.join(lines) + '\n'
+
+
+def write_file(path, *registries):
+    # file is replaced atomically so scraper (ex. node_exporter textfile collector) never reads partial content
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'w') as tmp_file:
+        tmp_file.write(exposition(*registries))
+    if hasattr(os, 'replace'):
+        os.replace(tmp_path, path)
+    else:
+        # python2 on windows can not rename to existing file
+        if os.name == 'nt' and os.path.exists(path):
+            os.remove(path)
+        os.rename(tmp_path, path)
+
+
+class MetricsServer(object):
+    """serves GET /metrics on local HTTP port in background thread"""
+
+    def __init__(self, registries, host='127.0.0.1', port=9105):
+        registries = list(registries)
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = exposition(*registries).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = HTTPServer((host, port), Handler)
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,126 @@
+# Copyright (c) 2019-2020 Anton Morozenko
+# See the file LICENSE for copying permission.
+"""
+Offline store for Blynk messages.
+Messages sent while device is disconnected are appended to fixed size ring file mapped into memory
+and replayed after connection is restored. If store is full the oldest messages are dropped.
+"""
+import mmap
+import os
+import struct
+
+STORE_SIZE = 65536
+
+
+class OfflineStore(object):
+    # header: magic, read offset, write offset, records count, used bytes
+    _HEAD = struct.Struct('!4sIIII')
+    _REC_HEAD = struct.Struct('!H')
+    _MAGIC = b'BLOS'
+
+    def __init__(self, path, size=STORE_SIZE):
+        if size <= self._HEAD.size + self._REC_HEAD.size:
+            raise ValueError('Store size={} is too small'.format(size))
+        self.path = path
+        self.size = size
+        self.capacity = size - self._HEAD.size
+        # number of messages dropped on overflow since store was opened
+        self.dropped = 0
+        self._file = open(path, 'r+b' if os.path.exists(path) else 'w+b')
+        self._file.seek(0, os.SEEK_END)
+        resized = self._file.tell() != size
+        if resized:
+            self._file.truncate(size)
+        self._mm = mmap.mmap(self._file.fileno(), size)
+        magic, self._head, self._tail, self._count, self._used = self._HEAD.unpack_from(self._mm, 0)
+        # stored data positions are not valid for other ring size
+        if resized or magic != self._MAGIC or max(self._head, self._tail, self._used) > self.capacity:
+            self.clear()
+
+    def __len__(self):
+        return self._count
+
+    def clear(self):
+        self._head = self._tail = self._count = self._used = 0
+        self._save_head()
+
+    def put(self, data):
+        """appends message to store. Returns False if message is larger than store capacity"""
+        rec_len = self._REC_HEAD.size + len(data)
+        if len(data) > 0xFFFF or rec_len > self.capacity:
+            return False
+        while self.capacity - self._used < rec_len:
+            self._drop()
+            self.dropped += 1
+        self._tail = self._write(self._tail, self._REC_HEAD.pack(len(data)))
+        self._tail = self._write(self._tail, data)
+        self._count += 1
+        self._used += rec_len
+        self._save_head()
+        return True
+
+    def put_front(self, data):
+        """inserts message before the oldest one, so it is replayed first. Returns False if it does not fit
+        cause message that would be dropped on overflow is this one"""
+        rec_len = self._REC_HEAD.size + len(data)
+        if len(data) > 0xFFFF or rec_len > self.capacity:
+            return False
+        if self.capacity - self._used < rec_len:
+            self.dropped += 1
+            return False
+        self._head = (self._head - rec_len) % self.capacity
+        self._write(self._write(self._head, self._REC_HEAD.pack(len(data))), data)
+        self._count += 1
+        self._used += rec_len
+        self._save_head()
+        return True
+
+    def get(self):
+        """removes and returns the oldest message or None if store is empty"""
+        if not self._count:
+            return None
+        pos, data_len = self._read_len(self._head)
+        pos, data = self._read(pos, data_len)
+        self._head = pos
+        self._count -= 1
+        self._used -= self._REC_HEAD.size + data_len
+        self._save_head()
+        return data
+
+    def flush(self):
+        self._mm.flush()
+
+    def close(self):
+        self._mm.flush()
+        self._mm.close()
+        self._file.close()
+
+    def _drop(self):
+        pos, data_len = self._read_len(self._head)
+        self._head = (pos + data_len) % self.capacity
+        self._count -= 1
+        self._used -= self._REC_HEAD.size + data_len
+
+    def _save_head(self):
+        self._HEAD.pack_into(self._mm, 0, self._MAGIC, self._head, self._tail, self._count, self._used)
+
+    def _read_len(self, pos):
+        pos, rec_head = self._read(pos, self._REC_HEAD.size)
+        return pos, self._REC_HEAD.unpack(rec_head)[0]
+
+    # ring data region starts right after header. Record may wrap around the end of region
+    def _write(self, pos, data):
+        start = self._HEAD.size + pos
+        first = min(len(data), self.capacity - pos)
+        self._mm[start:start + first] = data[:first]
+        if first < len(data):
+            self._mm[self._HEAD.size:self._HEAD.size + len(data) - first] = data[first:]
+        return (pos + len(data)) % self.capacity
+
+    def _read(self, pos, length):
+        start = self._HEAD.size + pos
+        first = min(length, self.capacity - pos)
+        data = self._mm[start:start + first]
+        if first < length:
+            data += self._mm[self._HEAD.size:self._HEAD.size + length - first]
+        return (pos + length) % self.capacity, data
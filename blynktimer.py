@@ -2,6 +2,8 @@
 """
 Polling timers for functions.
 Registers timers and performs run once or periodical function execution after defined time intervals.
+Timers are kept in min-heap ordered by next fire time, so run() waits till the earliest deadline
+and each firing costs O(log n). Monotonic clock is used so system time changes do not affect timers.
 """
 # select.select call used as polling waiter where it is possible
 # cause time.sleep sometimes may load CPU up to 100% with small polling wait interval
@@ -28,9 +30,46 @@ except ImportError:
         # case when micropython port does not support select.select
         polling_wait = lambda x: time.sleep(x)
 
+try:
+    import heapq
+except ImportError:
+    import uheapq as heapq
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    # micropython or python2 without 'futures' package backport
+    ThreadPoolExecutor = None
+
+if hasattr(time, 'ticks_ms'):
+    # micropython: ticks counter wraps around, so elapsed time is accumulated from ticks differences
+    _ticks = [time.ticks_ms(), 0]
+
+    def monotonic():
+        now = time.ticks_ms()
+        _ticks[1] += time.ticks_diff(now, _ticks[0])
+        _ticks[0] = now
+        return _ticks[1] / 1000.0
+elif hasattr(time, 'monotonic'):
+    monotonic = time.monotonic
+else:
+    # python2
+    monotonic = time.time
+
 WAIT_SEC = 0.05
 MAX_TIMERS = 16
 DEFAULT_INTERVAL = 10
+EXECUTOR_WORKERS = 4
+# with profile=True timer run taking longer than SLOW_RUN_MS is logged as warning
+SLOW_RUN_MS = 100
+# catch-up policies of fixed rate timers that fell behind schedule at least for one interval
+CATCH_UP_SKIP = 'skip'  # missed run is dropped, timer waits for the next scheduled deadline
+CATCH_UP_COALESCE = 'coalesce'  # all missed runs are merged into one run
+CATCH_UP_BURST = 'burst'  # every missed run is performed one by one without waiting
+
+
+def print_log(msg):
+    print(msg)
 
 
 class TimerError(Exception):
@@ -39,9 +78,28 @@ class TimerError(Exception):
 
 class Timer(object):
     timers = {}
+    # heap entries: (fire_time, seq, timer). Entry is stale if its seq differs from timer.seq or timer is stopped
+    _queue = []
+    _unscheduled = []
+    _seq = 0
+    # thread pool for timers registered with blocking=True and their not finished runs
+    _executor = None
+    _jobs = set()
 
-    def __init__(self, no_timers_err=True):
+    def __init__(self, no_timers_err=True, max_wait=WAIT_SEC, max_timers=MAX_TIMERS, metrics=None, profile=False,
+                 log=print_log):
+        # max_wait limits single run() wait to let other loops (ex. blynk.run) work between calls
+        # max_wait=None allows run() to sleep till the earliest timer deadline
         self.no_timers_err = no_timers_err
+        self.max_wait = max_wait
+        self.max_timers = max_timers
+        # blynkmetrics.Registry for timer runs, execution time and lag after deadline
+        self.metrics = metrics
+        self.slow_run_ms = SLOW_RUN_MS
+        # timer id -> [calls, total ms, max ms]
+        self._profile = {} if profile else None
+        # errors and slow runs of timer functions are reported with log callback, ex. log=blynk.log
+        self.log = log
 
     def _get_func_name(self, obj):
         """retrieves a suitable name for a function"""
@@ -56,14 +114,30 @@ class Timer(object):
         interval = kwargs.pop('interval', DEFAULT_INTERVAL)
         run_once = kwargs.pop('run_once', False)
         stopped = kwargs.pop('stopped', False)
+        # fixed rate timer is scheduled from its previous deadline instead of actual run time so run latency
+        # does not accumulate
+        fixed_rate = kwargs.pop('fixed_rate', False)
+        catch_up = kwargs.pop('catch_up', CATCH_UP_COALESCE)
+        if catch_up not in (CATCH_UP_SKIP, CATCH_UP_COALESCE, CATCH_UP_BURST):
+            raise TimerError('Unknown catch_up policy={}'.format(catch_up))
+        # blocking timer function runs in thread pool. Run is skipped if previous one is not finished yet
+        blocking = kwargs.pop('blocking', False)
+        if blocking and ThreadPoolExecutor is None:
+            raise TimerError('Blocking timers require concurrent.futures module')
 
         class Deco(object):
             def __init__(self, func):
                 self.func = func
-                if len(list(Timer.timers.keys())) >= MAX_TIMERS:
-                    raise TimerError('Max allowed timers num={}'.format(MAX_TIMERS))
+                if len(Timer.timers) >= blynk.max_timers:
+                    raise TimerError('Max allowed timers num={}'.format(blynk.max_timers))
                 _timer = _Timer(interval, func, run_once, stopped, *args, **kwargs)
-                Timer.timers['{}_{}'.format(len(list(Timer.timers.keys())), blynk._get_func_name(func))] = _timer
+                _timer.fixed_rate = fixed_rate
+                _timer.catch_up = catch_up
+                _timer.blocking = blocking
+                _timer.name = '{}_{}'.format(len(Timer.timers), blynk._get_func_name(func))
+                Timer.timers[_timer.name] = _timer
+                if not stopped:
+                    Timer._unscheduled.append(_timer)
 
             def __call__(self, *f_args, **f_kwargs):
                 return self.func(*f_args, **f_kwargs)
@@ -85,6 +159,7 @@ class Timer(object):
         Timer.timers[t_id].stopped = False
         Timer.timers[t_id].fire_time = None
         Timer.timers[t_id].fire_time_prev = None
+        Timer._unscheduled.append(timer)
 
     @staticmethod
     def is_stopped(t_id):
@@ -97,11 +172,116 @@ class Timer(object):
         states = {True: 'Stopped', False: 'Running'}
         return {k: states[v.stopped] for k, v in self.timers.items()}
 
+    def profile_stats(self):
+        """returns list of (timer id, calls, total ms, max ms) sorted by total time"""
+        if self._profile is None:
+            return []
+        stats = [(name,) + tuple(values) for name, values in self._profile.items()]
+        return sorted(stats, key=lambda item: item[2], reverse=True)
+
+    @staticmethod
+    def running_jobs():
+        return len(Timer._jobs)
+
+    def _submit(self, timer):
+        if Timer._executor is None:
+            Timer._executor = ThreadPoolExecutor(max_workers=EXECUTOR_WORKERS)
+        job = Timer._executor.submit(timer.deco, *timer.args, **timer.kwargs)
+        Timer._jobs.add(job)
+        job.add_done_callback(lambda done_job: self._job_done(timer, done_job))
+        return job
+
+    def _job_done(self, timer, job):
+        Timer._jobs.discard(job)
+        if not job.cancelled() and job.exception() is not None:
+            self.log('Timer {} error: {}'.format(timer.name, job.exception()))
+
+    def _measure_run(self, timer, lag, elapsed):
+        if self.metrics is not None:
+            self.metrics.inc('blynk_timer_runs_total')
+            self.metrics.observe('blynk_timer_lag_seconds', lag)
+            if elapsed is not None:
+                self.metrics.observe('blynk_timer_seconds', elapsed)
+        if self._profile is not None:
+            stats = self._profile.get(timer.name)
+            if stats is None:
+                stats = self._profile[timer.name] = [0, 0.0, 0.0]
+            stats[0] += 1
+            if elapsed is not None:
+                elapsed_ms = elapsed * 1000
+                stats[1] += elapsed_ms
+                stats[2] = max(stats[2], elapsed_ms)
+                if elapsed_ms > self.slow_run_ms:
+                    self.log('[WARNING] Slow timer: [\'{}\'] took {:.1f} ms'.format(timer.name, elapsed_ms))
+
+    @staticmethod
+    def _schedule(timer):
+        Timer._seq += 1
+        timer.seq = Timer._seq
+        heapq.heappush(Timer._queue, (timer.fire_time, timer.seq, timer))
+
+    def _next_fire_time(self):
+        """returns the earliest fire time of running timers or None if there are no running timers"""
+        if Timer._unscheduled:
+            curr_time = monotonic()
+            for timer in Timer._unscheduled:
+                if not timer.stopped:
+                    timer.start(curr_time)
+                    self._schedule(timer)
+            del Timer._unscheduled[:]
+        queue = Timer._queue
+        while queue and (queue[0][2].stopped or queue[0][1] != queue[0][2].seq):
+            heapq.heappop(queue)
+        return queue[0][0] if queue else None
+
+    def next_timeout(self):
+        """returns seconds left till the earliest timer deadline or None if there are no running timers"""
+        fire_time = self._next_fire_time()
+        if fire_time is None:
+            return None
+        return max(0, fire_time - monotonic())
+
     def run(self):
-        polling_wait(WAIT_SEC)
-        timers_intervals = [curr_timer.run() for curr_timer in Timer.timers.values() if not curr_timer.stopped]
-        if not timers_intervals and self.no_timers_err:
-            raise TimerError('Running timers not found')
+        timeout = self.next_timeout()
+        if timeout is None:
+            if self.no_timers_err:
+                raise TimerError('Running timers not found')
+            timeout = WAIT_SEC if self.max_wait is None else self.max_wait
+        elif self.max_wait is not None:
+            timeout = min(timeout, self.max_wait)
+        if timeout > 0:
+            polling_wait(timeout)
+        return self.fire()
+
+    def fire(self):
+        """runs all timers with passed deadline and returns their real intervals"""
+        curr_time = monotonic()
+        fired = []
+        while True:
+            fire_time = self._next_fire_time()
+            if fire_time is None or fire_time > curr_time:
+                break
+            fired.append(heapq.heappop(Timer._queue)[2])
+        timers_intervals = []
+        measured = self.metrics is not None or self._profile is not None
+        for timer in fired:
+            if measured:
+                lag = curr_time - timer.fire_time
+                start_time = monotonic()
+            try:
+                timer_real_interval = timer.run(curr_time, self._submit)
+            except Exception as err:
+                timer_real_interval = None
+                self.log('Timer {} error: {}'.format(timer.name, err))
+            finally:
+                # failed timer is returned to heap as well, so it and the rest of due timers keep running
+                if not timer.stopped:
+                    self._schedule(timer)
+            if timer_real_interval is not None:
+                timers_intervals.append(timer_real_interval)
+                if measured:
+                    # blocking timer only submits its run to thread pool, so loop time is not measured for it
+                    self._measure_run(timer, lag, None if timer.blocking else monotonic() - start_time)
         return timers_intervals
 
 
@@ -115,19 +295,49 @@ class _Timer(object):
         self.fire_time = None
         self.fire_time_prev = None
         self.stopped = stopped
+        self.seq = 0
+        self.name = None
+        self.fixed_rate = False
+        self.catch_up = CATCH_UP_COALESCE
+        self.blocking = False
+        self.job = None
 
-    def run(self):
-        timer_real_interval = 0
-        if self.fire_time is None:
-            self.fire_time = time.time() + self.interval
-        if self.fire_time_prev is None:
-            self.fire_time_prev = time.time()
-        curr_time = time.time()
-        if curr_time >= self.fire_time:
+    def start(self, curr_time):
+        self.fire_time = curr_time + self.interval
+        self.fire_time_prev = curr_time
+
+    def run(self, curr_time, submit):
+        # returns real interval since previous run or None if run was skipped
+        # submit - function that starts blocking timer run in thread pool and returns its job
+        behind = self.fixed_rate and self.interval > 0 and curr_time - self.fire_time >= self.interval
+        if behind and self.catch_up == CATCH_UP_SKIP:
+            self._next_deadline(curr_time)
+            return None
+        if self.blocking and self.job is not None and not self.job.done():
+            # previous run is still in progress
+            self._plan_next(curr_time, CATCH_UP_SKIP)
+            return None
+        # next run is planned before the call, so exception in function does not break timer schedule
+        if self.run_once:
+            self.stopped = True
+        timer_real_interval = curr_time - self.fire_time_prev
+        self.fire_time_prev = curr_time
+        self._plan_next(curr_time, self.catch_up)
+        if self.blocking:
+            self.job = submit(self)
+        else:
             self.deco(*self.args, **self.kwargs)
-            if self.run_once:
-                self.stopped = True
-            timer_real_interval = curr_time - self.fire_time_prev
-            self.fire_time_prev = self.fire_time
-            self.fire_time = curr_time + self.interval
         return timer_real_interval
+
+    def _plan_next(self, curr_time, catch_up):
+        if not self.fixed_rate or self.interval <= 0:
+            self.fire_time = curr_time + self.interval
+        elif catch_up == CATCH_UP_BURST:
+            self.fire_time += self.interval
+        else:
+            self._next_deadline(curr_time)
+
+    def _next_deadline(self, curr_time):
+        # the nearest deadline of timer schedule that is later than curr_time
+        missed = int((curr_time - self.fire_time) // self.interval)
+        self.fire_time += self.interval * (missed + 1)
@@ -74,6 +74,7 @@ def write_to_virtual_pin(vpin_num=1):
     blynk.virtual_write(vpin_num, value)
 
 
+# timer passed to blynk.run is served together with socket: loop waits for incoming data
+# no longer than till the nearest timer deadline
 while True:
-    blynk.run()
-    timer.run()
+    blynk.run(timer)
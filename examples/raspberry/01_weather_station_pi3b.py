@@ -149,40 +149,43 @@ def read_handler(vpin):
     dht22_sensor = Adafruit_DHT.DHT22  # possible sensor modifications .DHT11 .DHT22 .AM2302. Also DHT21 === DHT22
     humidity, temperature = Adafruit_DHT.read_retry(dht22_sensor, GPIO_DHT22_PIN, retries=5, delay_seconds=1)
     Counter.cycle += 1
-    # check that values are not False (mean not None)
-    if all([humidity, temperature]):
-        print('temperature={} humidity={}'.format(temperature, humidity))
-        if temperature <= T_CRI_VALUE:
-            blynk.set_property(T_VPIN, 'color', T_CRI_COLOR)
-            # send notifications not each time but once a minute (6*10 sec)
-            if Counter.cycle % 6 == 0:
-                blynk.notify(T_CRI_MSG)
-                Counter.cycle = 0
+    # messages below are collected and sent to server with single socket write
+    with blynk.batch():
+        # check that values are not False (mean not None)
+        if all([humidity, temperature]):
+            print('temperature={} humidity={}'.format(temperature, humidity))
+            if temperature <= T_CRI_VALUE:
+                blynk.set_property(T_VPIN, 'color', T_CRI_COLOR)
+                # send notifications not each time but once a minute (6*10 sec)
+                if Counter.cycle % 6 == 0:
+                    blynk.notify(T_CRI_MSG)
+                    Counter.cycle = 0
+            else:
+                blynk.set_property(T_VPIN, 'color', T_COLOR)
+            blynk.set_property(H_VPIN, 'color', H_COLOR)
+            blynk.virtual_write(T_VPIN, temperature)
+            blynk.virtual_write(H_VPIN, humidity)
         else:
-            blynk.set_property(T_VPIN, 'color', T_COLOR)
-        blynk.set_property(H_VPIN, 'color', H_COLOR)
-        blynk.virtual_write(T_VPIN, temperature)
-        blynk.virtual_write(H_VPIN, humidity)
-    else:
-        print('[ERROR] reading DHT22 sensor data')
-        blynk.set_property(T_VPIN, 'color', ERR_COLOR)  # show aka 'disabled' that mean we errors on data read
-        blynk.set_property(H_VPIN, 'color', ERR_COLOR)
+            print('[ERROR] reading DHT22 sensor data')
+            blynk.set_property(T_VPIN, 'color', ERR_COLOR)  # show aka 'disabled' that mean we errors on data read
+            blynk.set_property(H_VPIN, 'color', ERR_COLOR)
 
     # BMP180
     bmp180_sensor = BMP085.BMP085(busnum=1)
     pressure = bmp180_sensor.read_pressure()
     altitude = bmp180_sensor.read_altitude()
-    # check that values are not False (mean not None)
-    if all([pressure, altitude]):
-        print('pressure={} altitude={}'.format(pressure, altitude))
-        blynk.set_property(P_VPIN, 'color', P_COLOR)
-        blynk.set_property(A_VPIN, 'color', A_COLOR)
-        blynk.virtual_write(P_VPIN, pressure / 133.322)  # mmHg  1mmHg = 133.322 Pa
-        blynk.virtual_write(A_VPIN, altitude)
-    else:
-        print('[ERROR] reading BMP180 sensor data')
-        blynk.set_property(P_VPIN, 'color', ERR_COLOR)  # show aka 'disabled' that mean we errors on data read
-        blynk.set_property(A_VPIN, 'color', ERR_COLOR)
+    with blynk.batch():
+        # check that values are not False (mean not None)
+        if all([pressure, altitude]):
+            print('pressure={} altitude={}'.format(pressure, altitude))
+            blynk.set_property(P_VPIN, 'color', P_COLOR)
+            blynk.set_property(A_VPIN, 'color', A_COLOR)
+            blynk.virtual_write(P_VPIN, pressure / 133.322)  # mmHg  1mmHg = 133.322 Pa
+            blynk.virtual_write(A_VPIN, altitude)
+        else:
+            print('[ERROR] reading BMP180 sensor data')
+            blynk.set_property(P_VPIN, 'color', ERR_COLOR)  # show aka 'disabled' that mean we errors on data read
+            blynk.set_property(A_VPIN, 'color', ERR_COLOR)
 
 
 ###########################################################
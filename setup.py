@@ -1,8 +1,14 @@
+import sys
 from setuptools import setup
 
 with open("README.md", "r") as fh:
     long_description = fh.read()
 
+py_modules = ['blynklib', 'blynktimer', 'blynklib_mp', 'blynkstore', 'blynkmetrics']
+# gateway uses selectors module and asyncio client uses 'async def' syntax, both are not available in Python 2
+if sys.version_info >= (3, 5):
+    py_modules += ['blynklib_async', 'blynkgateway']
+
 setup(
     name='blynklib',
     version='0.2.6',
@@ -15,7 +21,7 @@ setup(
     author_email='antoha.ua@gmail.com',
     setup_requires=['pytest-runner', ],
     tests_require=['pytest', 'pytest-mock>=1.11.2', ],
-    py_modules=['blynklib', 'blynktimer', 'blynklib_mp'],
+    py_modules=py_modules,
     classifiers=[
         "Programming Language :: Python :: 2.7",
         "Programming Language :: Python :: 3",
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+import os
+import subprocess
+import pytest
+from mock_server import MockServer
+
+
+@pytest.fixture
+def mock_server_factory():
+    # starts mock servers with given options, ex. mock_server_factory(latency=0.05, fragment=1)
+    servers = []
+
+    def factory(**kwargs):
+        server = MockServer(**kwargs).start()
+        servers.append(server)
+        return server
+
+    yield factory
+    for server in servers:
+        server.stop()
+
+
+@pytest.fixture
+def mock_server(mock_server_factory):
+    yield mock_server_factory()
+
+
+@pytest.fixture(scope='session')
+def tls_cert(tmp_path_factory):
+    """self-signed certificate for 127.0.0.1 generated with openssl. Returns (cert path, key path)"""
+    path = tmp_path_factory.mktemp('tls')
+    cert, key = str(path / 'cert.pem'), str(path / 'key.pem')
+    try:
+        subprocess.check_call(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                               '-subj', '/CN=127.0.0.1', '-addext', 'subjectAltName=IP:127.0.0.1',
+                               '-keyout', key, '-out', cert], stdout=open(os.devnull, 'w'), stderr=subprocess.STDOUT)
+    except (OSError, subprocess.CalledProcessError):
+        pytest.skip('openssl is required to generate test certificate')
+    yield cert, key
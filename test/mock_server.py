@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+Local mock Blynk server for tests over real TCP connection.
+Server runs asyncio loop in background thread, so it can serve both blocking Blynk and AsyncBlynk clients.
+It answers login, heartbeat and ping messages, records all received messages, can redirect clients and
+inject latency, fragmentation and drops of incoming messages.
+"""
+import asyncio
+import random
+import socket
+import threading
+import time
+from blynklib import Protocol
+
+
+class MockClient(object):
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.token = None
+        self.authenticated = False
+        # outgoing (due time, data) items. Single writer task keeps order of delayed messages
+        self.queue = asyncio.Queue()
+        self.write_task = None
+
+
+class MockServer(object):
+    def __init__(self, tokens=None, redirect=None, latency=0, fragment=0, drop=None, seed=0, ssl_context=None):
+        # tokens - accepted auth tokens, any token is accepted if None
+        # redirect - (host, port) clients are redirected to on login
+        # latency - delay in sec of every message sent by server
+        # fragment - server messages are written by chunks of this size with pauses between them
+        # drop - {msg_type: probability} of incoming message being ignored without response
+        # ssl_context - server side ssl.SSLContext to serve TLS connections
+        self.tokens = tokens
+        self.redirect = redirect
+        self.latency = latency
+        self.fragment = fragment
+        self.drop = drop or {}
+        self.ssl_context = ssl_context
+        self.protocol = Protocol()
+        self.received = []
+        self.connections = 0
+        self.clients = set()
+        # optional callback(server, client, msg_type, msg_id, args) called for every processed message
+        self.on_message = None
+        self.port = None
+        self._random = random.Random(seed)
+        self._loop = None
+        self._server = None
+        self._thread = None
+
+    def start(self, host='127.0.0.1', port=0):
+        started = threading.Event()
+
+        def serve():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            start = asyncio.start_server(self._handle, host, port, ssl=self.ssl_context)
+            self._server = self._loop.run_until_complete(start)
+            self.port = self._server.sockets[0].getsockname()[1]
+            started.set()
+            self._loop.run_forever()
+            self._loop.close()
+
+        self._thread = threading.Thread(target=serve)
+        self._thread.daemon = True
+        self._thread.start()
+        started.wait(5)
+        return self
+
+    def stop(self):
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result(5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(5)
+        self._loop = None
+
+    def send(self, msg_type, *args, **kwargs):
+        """sends message to all authenticated clients. Can be called from any thread"""
+        data = self.protocol._pack_msg(msg_type, *args, **kwargs)
+        self._loop.call_soon_threadsafe(self._broadcast, data)
+
+    def virtual_write(self, pin, *values):
+        self.send(Protocol.MSG_HW, 'vw', pin, *values)
+
+    def disconnect_clients(self):
+        """closes all client connections to test reconnects"""
+        self._loop.call_soon_threadsafe(self._close_clients)
+
+    def messages(self, msg_type=None):
+        """returns received (msg_type, msg_id, args) filtered by message type"""
+        return [msg for msg in list(self.received) if msg_type is None or msg[0] == msg_type]
+
+    def wait_for(self, predicate, timeout=5, poll=None):
+        # poll - function called while waiting, ex. blocking client run() in the same test thread
+        end_time = time.time() + timeout
+        while not predicate():
+            if time.time() > end_time:
+                return False
+            if poll is not None:
+                poll()
+            else:
+                time.sleep(0.005)
+        return True
+
+    async def _shutdown(self):
+        self._server.close()
+        self._close_clients()
+        # lets client handlers and writer tasks finish
+        await asyncio.sleep(0.01)
+        await self._server.wait_closed()
+
+    def _broadcast(self, data):
+        for client in self.clients:
+            if client.authenticated:
+                self._write(client, data)
+
+    def _close_clients(self):
+        for client in list(self.clients):
+            client.writer.close()
+            if client.write_task is not None:
+                client.write_task.cancel()
+        self.clients.clear()
+
+    def _write(self, client, data):
+        client.queue.put_nowait((self._loop.time() + self.latency, data))
+
+    async def _write_loop(self, client):
+        while True:
+            due_time, data = await client.queue.get()
+            delay = due_time - self._loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if not self.fragment:
+                client.writer.write(data)
+                await client.writer.drain()
+                continue
+            for idx in range(0, len(data), self.fragment):
+                client.writer.write(data[idx:idx + self.fragment])
+                await client.writer.drain()
+                # pause lets client read each chunk separately
+                await asyncio.sleep(0.001)
+
+    async def _handle(self, reader, writer):
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        client = MockClient(reader, writer)
+        client.write_task = asyncio.ensure_future(self._write_loop(client))
+        self.clients.add(client)
+        self.connections += 1
+        try:
+            while True:
+                head = await reader.readexactly(Protocol.MSG_HEAD_LEN)
+                msg_type, msg_id, length = Protocol.MSG_HEAD.unpack(head)
+                body = b''
+                # response carries status in length field and has no body
+                if msg_type != Protocol.MSG_RSP and length:
+                    body = await reader.readexactly(length)
+                args = body.decode('utf-8').split('\0') if body else []
+                self.received.append((msg_type, msg_id, args))
+                if self._random.random() < self.drop.get(msg_type, 0):
+                    continue
+                if not self._process(client, msg_type, msg_id, args):
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.clients.discard(client)
+            client.write_task.cancel()
+            writer.close()
+
+    def _response(self, client, msg_id, status=Protocol.STATUS_OK):
+        self._write(client, Protocol.MSG_HEAD.pack(Protocol.MSG_RSP, msg_id, status))
+
+    def _process(self, client, msg_type, msg_id, args):
+        # returns False if connection should be closed
+        if msg_type == Protocol.MSG_LOGIN:
+            client.token = args[0] if args else None
+            if self.redirect is not None:
+                host, port = self.redirect
+                self._write(client, self.protocol._pack_msg(Protocol.MSG_REDIRECT, host, port, msg_id=msg_id))
+                return True
+            if self.tokens is not None and client.token not in self.tokens:
+                self._response(client, msg_id, Protocol.STATUS_INVALID_TOKEN)
+                return True
+            client.authenticated = True
+            self._response(client, msg_id)
+        elif not client.authenticated:
+            return False
+        elif msg_type in (Protocol.MSG_PING, Protocol.MSG_INTERNAL):
+            # heartbeat settings are sent as internal message
+            self._response(client, msg_id)
+        if self.on_message is not None:
+            self.on_message(self, client, msg_type, msg_id, args)
+        return True
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import pytest
+from blynklib import Protocol
+from blynklib_async import AsyncBlynk
+
+
+def run_async(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+class TestAsyncBlynk:
+    @pytest.fixture
+    def server(self):
+        # minimal server: accepts login and heartbeat, then sends prepared messages in one write
+        class Server(object):
+            protocol = Protocol()
+            messages = b''
+            received = []
+            login_status = 200
+
+            async def handle(self, reader, writer):
+                for status in (self.login_status, 200):
+                    head = await reader.readexactly(5)
+                    msg_len = self.protocol.frame_len(head)
+                    await reader.readexactly(msg_len - 5)
+                    writer.write(Protocol.MSG_HEAD.pack(Protocol.MSG_RSP, 1, status))
+                    if status != 200:
+                        writer.close()
+                        return
+                writer.write(self.messages)
+                while True:
+                    data = await reader.read(1024)
+                    if not data:
+                        break
+                    self.received.append(data)
+
+            async def start(self):
+                self.srv = await asyncio.start_server(self.handle, '127.0.0.1', 0)
+                return self.srv.sockets[0].getsockname()[1]
+
+        yield Server()
+
+    def test_connect_and_dispatch(self, server):
+        protocol = Protocol()
+        server.messages = (protocol._pack_msg(Protocol.MSG_HW, 'vw', 4, 42, msg_id=2) +
+                           protocol._pack_msg(Protocol.MSG_HW, 'vr', 7, msg_id=3))
+        calls = []
+
+        async def scenario():
+            port = await server.start()
+            bl = AsyncBlynk('1234', server='127.0.0.1', port=port)
+            bl._events = {}
+            done = asyncio.Event()
+
+            @bl.handle_event('write V4')
+            def write_handler(pin, value):
+                calls.append(('write', pin, value))
+
+            @bl.handle_event('read V7')
+            async def read_handler(pin):
+                await asyncio.sleep(0)
+                calls.append(('read', pin))
+                bl.virtual_write(pin, 'abc')
+                done.set()
+
+            run_task = asyncio.ensure_future(bl.run())
+            await asyncio.wait_for(done.wait(), 5)
+            await asyncio.sleep(0.1)
+            run_task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await run_task
+            await asyncio.sleep(0.05)
+            server.srv.close()
+            return bl
+
+        bl = run_async(scenario())
+        assert calls == [('write', 4, [u'42']), ('read', 7)]
+        assert not bl.connected()
+        assert server.received[0] == protocol._pack_msg(Protocol.MSG_HW, 'vw', 7, 'abc', msg_id=3)
+
+    def test_connect_invalid_token(self, server):
+        server.login_status = 9
+
+        async def scenario():
+            port = await server.start()
+            bl = AsyncBlynk('1234', server='127.0.0.1', port=port)
+            bl.RECONNECT_SLEEP = 0
+            result = await bl.connect(timeout=0)
+            server.srv.close()
+            return result
+
+        assert run_async(scenario()) is False
+
+    def test_send_without_connection(self):
+        bl = AsyncBlynk('1234')
+        assert bl.send(b'123') is None
+
+    def test_send_batch(self):
+        bl = AsyncBlynk('1234')
+        with bl.batch():
+            assert bl.virtual_write(1, 2) == 11
+            assert bl._batch == Protocol.MSG_HEAD.pack(Protocol.MSG_HW, 1, 6) + b'vw\x001\x002'
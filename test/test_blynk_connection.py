@@ -1,8 +1,11 @@
 # -*- coding: utf-8 -*-
 from __future__ import print_function
+import errno
 import time
 import pytest
+import select
 import socket
+import ssl
 from blynklib import Connection, BlynkError, RedirectError
 
 
@@ -14,34 +17,114 @@ class TestBlynkConnection:
 
     def test_send(self, cb, mocker):
         cb._socket = socket.socket()
-        mocker.patch('socket.socket.send', return_value=5)
-        result = cb.send('1234')
-        assert result == 5
+        mocker.patch('socket.socket.send', return_value=4)
+        result = cb.send(b'1234')
+        assert result == 4
+        assert cb.tx_buffered() == 0
+
+    def test_send_partial_write(self, cb, mocker):
+        cb._socket = socket.socket()
+        sent = []
+        mocker.patch('socket.socket.send', side_effect=lambda data: sent.append(bytes(data)) or 3)
+        result = cb.send(b'1234')
+        assert result == 4
+        assert cb._tx_buffer == b'4'
+        cb._flush_socket()
+        assert cb.tx_buffered() == 0
+        assert sent == [b'1234', b'4']
+
+    @pytest.mark.parametrize('error', [OSError(errno.EAGAIN, 'EAGAIN'), socket.timeout()])
+    def test_send_would_block(self, cb, mocker, error):
+        cb._socket = socket.socket()
+        mocker.patch('socket.socket.send', side_effect=error)
+        mocker.spy(time, 'sleep')
+        result = cb.send(b'1234')
+        assert result == 4
+        assert cb.tx_buffered() == 4
+        assert time.sleep.call_count == 0
 
     def test_send_ioerror(self, cb, mocker):
         cb._socket = socket.socket()
         mocker.patch('socket.socket.send', side_effect=IOError('IO'))
-        result = cb.send('1234')
+        result = cb.send(b'1234')
         assert result is None
+        assert cb.tx_buffered() == 0
 
     def test_send_oserror(self, cb, mocker):
         cb._socket = socket.socket()
-        mocker.patch('socket.socket.send', side_effect=OSError('OS'))
-        result = cb.send('1234')
+        mocker.patch('socket.socket.send', side_effect=OSError(errno.EPIPE, 'EPIPE'))
+        result = cb.send(b'1234')
         assert result is None
+        assert cb.tx_buffered() == 0
 
-    def test_send_socket_timeout(self, cb, mocker):
+    def test_send_buffer_full(self, cb, mocker):
         cb._socket = socket.socket()
+        cb.TX_BUFFER_MAX = 6
         mocker.patch('socket.socket.send', side_effect=socket.timeout())
-        result = cb.send('1234')
-        assert result is None
+        assert cb.send(b'1234') == 4
+        assert cb.send(b'567') == 0
+        assert cb.tx_buffered() == 4
 
-    def test_send_error_retry_count(self, cb, mocker):
+    def test_send_all(self, cb, mocker):
         cb._socket = socket.socket()
-        mocker.patch('socket.socket.send', side_effect=OSError('OS'))
-        mocker.spy(time, 'sleep')
-        cb.send('1234')
-        assert cb._socket.send.call_count == 3
+        mocker.patch('socket.socket.send', return_value=4)
+        result = cb.send_all(b'1234')
+        assert result == 4
+
+    def test_batch(self, cb, mocker):
+        cb._socket = socket.socket()
+        sent = []
+        mocker.patch('socket.socket.send', side_effect=lambda data: sent.append(bytes(data)) or 5)
+        with cb.batch():
+            assert cb.send(b'12') == 2
+            with cb.batch():
+                assert cb.send(b'34') == 2
+            assert cb.send_all(b'5') == 1
+            assert not sent
+        assert sent == [b'12345']
+        assert cb._batch is None
+
+    def test_batch_exception(self, cb, mocker):
+        cb._socket = socket.socket()
+        mocker.patch('socket.socket.send', return_value=None)
+        with pytest.raises(ValueError):
+            with cb.batch():
+                cb.send(b'12')
+                raise ValueError()
+        assert cb._socket.send.call_count == 0
+        assert cb._batch is None
+
+    def test_batch_in_worker_thread(self, cb, mocker):
+        import threading
+        sent = []
+        cb._socket = mocker.Mock()
+        cb._socket.send.side_effect = lambda data: sent.append(bytes(data)) or len(data)
+        cb._io_thread_id = threading.current_thread().ident
+        entered, io_sent = threading.Event(), threading.Event()
+
+        def worker():
+            try:
+                with cb.batch():
+                    cb._send_limited(b'w1', 'key')
+                    entered.set()
+                    io_sent.wait(1)
+                    raise ValueError()
+            except ValueError:
+                pass
+            with cb.batch():
+                cb.send(b'w2')
+                cb._send_limited(b'w3', 'key')
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        entered.wait(1)
+        # io thread message sent while worker is inside batch is not collected by worker batch
+        cb.send(b'io')
+        io_sent.set()
+        thread.join(1)
+        assert sent == [b'io']
+        # dropped batch is not queued, finished one is queued as single message
+        assert list(cb._tx_queue) == [(None, bytearray(b'w2w3'))]
 
     def test_receive(self, cb, mocker):
         cb._socket = socket.socket()
@@ -49,28 +132,54 @@ class TestBlynkConnection:
         result = cb.receive(10, 1)
         assert result == b'12345'
 
+    def test_send_keeps_socket_mode(self, cb, mocker):
+        cb._socket = socket.socket()
+        mocker.patch('socket.socket.send', return_value=4)
+        mocker.patch('socket.socket.settimeout')
+        cb.send(b'1234')
+        assert socket.socket.settimeout.call_count == 0
+
+    def test_receive_waits_with_select(self, cb, mocker):
+        cb._socket = socket.socket()
+        clock = [100.0]
+        mocker.patch('blynklib.monotonic', side_effect=lambda: clock[0])
+        mocker.patch('select.select', side_effect=lambda r, w, x, wait: clock.__setitem__(0, clock[0] + wait))
+        mocker.patch('socket.socket.recv', side_effect=OSError(errno.EAGAIN, 'EAGAIN'))
+        assert cb.receive(10, 1) == b''
+        select.select.assert_called_once_with([cb._socket], [], [], 1)
+        assert cb.receive(10, 0) == b''
+        assert select.select.call_count == 1
+
+    def test_receive_retries_ssl_want_read(self, cb, mocker):
+        # TLS 1.3 session ticket makes socket readable without application data
+        cb._socket = socket.socket()
+        mocker.patch('select.select', return_value=([cb._socket], [], []))
+        mocker.patch('socket.socket.recv', side_effect=[ssl.SSLWantReadError(), b'12345'])
+        assert cb.receive(10, 1) == b'12345'
+        assert select.select.call_count == 2
+
     def test_receive_timeout(self, cb, mocker):
         cb._socket = socket.socket()
         mocker.patch('socket.socket.recv', side_effect=OSError('timed out'))
-        result = cb.receive(10, 1)
+        result = cb.receive(10, 0)
         assert result == b''
 
     def test_receive_timeout_2(self, cb, mocker):
         cb._socket = socket.socket()
         mocker.patch('socket.socket.recv', side_effect=socket.timeout('timed out'))
-        result = cb.receive(10, 1)
+        result = cb.receive(10, 0)
         assert result == b''
 
     def test_receive_eagain(self, cb, mocker):
         cb._socket = socket.socket()
         mocker.patch('socket.socket.recv', side_effect=IOError('[Errno 11]'))
-        result = cb.receive(10, 1)
+        result = cb.receive(10, 0)
         assert result == b''
 
     def test_receive_etimeout(self, cb, mocker):
         cb._socket = socket.socket()
         mocker.patch('socket.socket.recv', side_effect=OSError('[Errno 60]'))
-        result = cb.receive(10, 1)
+        result = cb.receive(10, 0)
         assert result == b''
 
     def test_receive_raise_other_oserror(self, cb, mocker):
@@ -80,6 +189,26 @@ class TestBlynkConnection:
             cb.receive(10, 1)
         assert '[Errno 13]' in str(os_err.value)
 
+    def test_read_frames_coalesced(self, cb):
+        data = b'\x06\x00\x01\x00\x00\x14\x00\x02\x00\x06vw\x004\x001\x00\x00\x03\x00\xc8'
+        result = cb.read_frames(data)
+        assert result == [(6, 1, 0, []), (20, 2, 6, [u'vw', u'4', u'1']), (0, 3, 200, [])]
+        assert cb._rx_buffer == b''
+
+    def test_read_frames_split(self, cb):
+        assert cb.read_frames(b'\x14\x00\x02') == []
+        assert cb.read_frames(b'\x00\x06vw\x004') == []
+        assert cb._rx_buffer == b'\x14\x00\x02\x00\x06vw\x004'
+        result = cb.read_frames(b'\x001\x06\x00')
+        assert result == [(20, 2, 6, [u'vw', u'4', u'1'])]
+        assert cb._rx_buffer == b'\x06\x00'
+
+    def test_read_frames_command_too_long(self, cb):
+        cb.rcv_buffer = 10
+        with pytest.raises(BlynkError) as b_err:
+            cb.read_frames(b'\x14\x00\x02\x00\x13test')
+        assert 'Command too long' in str(b_err.value)
+
     def test_is_server_alive_negative(self, cb):
         result = cb.is_server_alive()
         assert result is False
@@ -102,13 +231,86 @@ class TestBlynkConnection:
         result = cb.is_server_alive()
         assert result is True
 
-    def test_get_socket(self, cb, mocker):
+    @pytest.fixture
+    def dns_cache(self):
+        Connection._dns_cache = {}
+        yield Connection._dns_cache
+        Connection._dns_cache = {}
+
+    @pytest.fixture
+    def listener(self):
+        srv = socket.socket()
+        srv.bind(('127.0.0.1', 0))
+        srv.listen(1)
+        yield srv
+        srv.close()
+
+    def test_get_socket(self, cb, mocker, dns_cache):
         mocker.patch('socket.socket')
-        mocker.patch('socket.getaddrinfo')
+        socket.socket.return_value.connect_ex.return_value = 0
+        mocker.patch('socket.getaddrinfo', return_value=[(socket.AF_INET, socket.SOCK_STREAM, 6, '', ('127.0.0.1', 80))])
         cb._get_socket()
         assert cb._state == cb.CONNECTING
+        socket.socket.return_value.connect_ex.assert_called_once_with(('127.0.0.1', 80))
+        # socket is left in non-blocking mode for the whole session
+        assert socket.socket.return_value.setblocking.call_args_list[-1] == mocker.call(False)
+
+    def test_resolve_cache(self, cb, mocker, dns_cache):
+        addr_info = [(socket.AF_INET, socket.SOCK_STREAM, 6, '', ('10.0.0.1', 80)),
+                     (socket.AF_INET, socket.SOCK_STREAM, 6, '', ('10.0.0.2', 80)),
+                     (socket.AF_INET6, socket.SOCK_STREAM, 6, '', ('::1', 80, 0, 0)),
+                     (socket.AF_INET, socket.SOCK_STREAM, 6, '', ('10.0.0.1', 80))]
+        mocker.patch('socket.getaddrinfo', return_value=addr_info)
+        clock = mocker.patch('blynklib.ticks_ms', return_value=1000)
+        addrs = cb._resolve()
+        # families are interleaved and duplicates removed
+        assert addrs == [(socket.AF_INET, ('10.0.0.1', 80)), (socket.AF_INET6, ('::1', 80, 0, 0)),
+                         (socket.AF_INET, ('10.0.0.2', 80))]
+        assert cb._resolve() == addrs
+        assert socket.getaddrinfo.call_count == 1
+        # expired entry is used when DNS is not available
+        clock.return_value = 1000 + cb.DNS_TTL * 1000
+        socket.getaddrinfo.side_effect = socket.gaierror('resolver is down')
+        assert cb._resolve() == addrs
+        assert socket.getaddrinfo.call_count == 2
+
+    def test_resolve_error(self, cb, mocker, dns_cache):
+        mocker.patch('socket.getaddrinfo', side_effect=socket.gaierror('resolver is down'))
+        with pytest.raises(socket.gaierror):
+            cb._resolve()
+
+    def test_open_socket_fallback(self, cb, listener):
+        closed = socket.socket()
+        closed.bind(('127.0.0.1', 0))
+        closed_addr = closed.getsockname()
+        closed.close()
+        sock = cb._open_socket([(socket.AF_INET, closed_addr), (socket.AF_INET, listener.getsockname())])
+        assert sock.getpeername() == listener.getsockname()
+        sock.close()
+
+    def test_open_socket_family_not_supported(self, cb, listener, mocker):
+        real_socket = socket.socket
+
+        def make_socket(family, *args):
+            if family == socket.AF_INET6:
+                raise OSError(errno.EAFNOSUPPORT, 'Address family not supported by protocol')
+            return real_socket(family, *args)
+
+        mocker.patch('socket.socket', side_effect=make_socket)
+        sock = cb._open_socket([(socket.AF_INET6, ('::1', 80, 0, 0)), (socket.AF_INET, listener.getsockname())])
+        assert sock.getpeername() == listener.getsockname()
+        sock.close()
+
+    def test_open_socket_error(self, cb):
+        closed = socket.socket()
+        closed.bind(('127.0.0.1', 0))
+        closed_addr = closed.getsockname()
+        closed.close()
+        with pytest.raises(BlynkError) as b_err:
+            cb._open_socket([(socket.AF_INET, closed_addr)])
+        assert '127.0.0.1' in str(b_err.value)
 
-    def test_get_socket_exception(self, cb, mocker):
+    def test_get_socket_exception(self, cb, mocker, dns_cache):
         mocker.patch('socket.socket')
         mocker.patch('socket.getaddrinfo', side_effect=BlynkError('BE'))
         with pytest.raises(BlynkError) as b_err:
@@ -170,6 +372,12 @@ class TestBlynkConnection:
         mocker.patch.object(cb, 'receive', return_value=b'\x00\x00\x02\x00\xc8')
         cb._set_heartbeat()
 
+    def test_set_heartbeat_keeps_tail(self, cb, mocker):
+        mocker.patch.object(cb, 'send', return_value=None)
+        mocker.patch.object(cb, 'receive', return_value=b'\x00\x00\x02\x00\xc8\x06\x00\x03')
+        cb._set_heartbeat()
+        assert cb._rx_buffer == b'\x06\x00\x03'
+
     def test_connected_false(self, cb):
         result = cb.connected()
         assert result is False
@@ -178,3 +386,147 @@ class TestBlynkConnection:
         cb._state = cb.AUTHENTICATED
         result = cb.connected()
         assert result is True
+
+    def test_sleep_ms(self, mocker):
+        from blynklib import sleep_ms
+        mocker.patch('time.sleep', return_value=None)
+        sleep_ms(50)
+        time.sleep.assert_called_once_with(0.05)
+
+    def test_schedule_reconnect_backoff(self, cb, mocker):
+        mocker.patch('blynklib.ticks_ms', return_value=1000)
+        mocker.patch('random.uniform', side_effect=lambda low, high: high)
+        delays = [cb._schedule_reconnect() for _ in range(8)]
+        assert delays == [1, 2, 4, 8, 16, 32, 60, 60]
+        assert cb._reconnect_at == 61000
+
+    def test_schedule_reconnect_jitter(self, cb):
+        for attempt in range(20):
+            assert 0 <= cb._schedule_reconnect() <= min(cb.RECONNECT_MAX_SLEEP, 2 ** attempt)
+
+    def test_ssl_context_cached(self, mocker):
+        mocker.patch.object(Connection, '_ssl_contexts', {})
+        mocker.patch('ssl.create_default_context')
+        first = Connection('1234', ssl_cert='default')._get_ssl_context()
+        second = Connection('5678', ssl_cert='default')._get_ssl_context()
+        assert first is second
+        ssl.create_default_context.assert_called_once_with(cafile=None)
+
+    def test_ssl_session_resumption(self, cb, mocker):
+        cb.ssl_cert = 'default'
+        context = mocker.Mock()
+        mocker.patch.object(cb, '_get_ssl_context', return_value=context)
+        sock = mocker.Mock(session='session1', session_reused=False)
+        context.wrap_socket.return_value = sock
+        cb._socket = cb._wrap_ssl('raw')
+        cb._ssl_established()
+        context.wrap_socket.assert_called_with('raw', server_hostname=cb.server)
+        assert cb.ssl_session_reused is False
+        # session ticket received after handshake is saved on close
+        sock.session = 'session2'
+        cb._save_ssl_session()
+        sock.session_reused = True
+        cb._socket = cb._wrap_ssl('raw', do_handshake_on_connect=False)
+        cb._ssl_established()
+        context.wrap_socket.assert_called_with('raw', server_hostname=cb.server, session='session2',
+                                               do_handshake_on_connect=False)
+        assert cb.ssl_session_reused is True
+        # session is not offered to redirected server
+        cb.server = 'other.server'
+        cb._wrap_ssl('raw')
+        context.wrap_socket.assert_called_with('raw', server_hostname='other.server')
+
+    def test_tune_socket_defaults(self, cb):
+        sock = socket.socket()
+        cb._tune_socket(sock)
+        assert sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY) != 0
+        assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE) == 0
+        sock.close()
+
+    def test_tune_socket_options(self, cb):
+        cb.TCP_NODELAY = False
+        cb.TCP_KEEPALIVE = (30, 5, 3)
+        cb.SOCK_SNDBUF = 16384
+        sock = socket.socket()
+        cb._tune_socket(sock)
+        assert sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY) == 0
+        assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE) != 0
+        if hasattr(socket, 'TCP_KEEPINTVL'):
+            assert sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL) == 5
+        # kernel may adjust requested buffer size
+        assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF) >= 16384
+        sock.close()
+
+    def test_tune_socket_error(self, cb, mocker):
+        cb.SOCK_SNDBUF = 16384
+        sock = mocker.Mock()
+        sock.setsockopt.side_effect = [OSError('not supported'), None]
+        mocker.patch.object(cb, 'log')
+        cb._tune_socket(sock)
+        # failed option does not skip the next one
+        assert sock.setsockopt.call_args == mocker.call(socket.SOL_SOCKET, socket.SO_SNDBUF, 16384)
+        cb.log.assert_called_once_with('Socket option TCP_NODELAY not applied: not supported')
+
+    def test_ping_rtt_tracking(self, cb, mocker):
+        clock = mocker.patch('blynklib.monotonic', return_value=1000.0)
+        # wall clock change does not affect measured rtt
+        mocker.patch('time.time', return_value=0.0)
+        cb._last_rcv_time = cb._last_send_time = cb._last_ping_time = 0
+        mocker.patch('blynklib.ticks_ms', return_value=cb.heartbeat * 1000 + 1)
+        mocker.patch.object(cb, 'send', return_value=None)
+        assert cb.rtt_stats() is None
+        cb.is_server_alive()
+        cb.send.assert_called_once_with(cb.ping_msg(msg_id=1))
+        clock.return_value = 1000.02
+        cb._rtt_response(1)
+        # unknown msg_id is ignored
+        cb._rtt_response(1)
+        stats = cb.rtt_stats()
+        assert stats['count'] == 1
+        assert stats['min'] == pytest.approx(20)
+        assert stats['avg'] == pytest.approx(20)
+        assert stats['p99'] == pytest.approx(20)
+        assert not cb._rtt_pending
+
+    def test_rtt_stats(self, cb):
+        for rtt in range(1, 201):
+            cb._rtt_samples.append(float(rtt))
+        cb._rtt_min = 1.0
+        stats = cb.rtt_stats()
+        assert stats['count'] == cb.RTT_SAMPLES
+        assert stats['avg'] == pytest.approx(150.5)
+        assert stats['p99'] == 200
+        assert stats['last'] == 200
+
+    def test_rtt_pending_limit(self, cb, mocker):
+        mocker.patch.object(cb, 'send', return_value=None)
+        for _ in range(cb.RTT_PENDING_MAX + 3):
+            cb._last_rcv_time = cb._last_send_time = cb._last_ping_time = 0
+            mocker.patch('blynklib.ticks_ms', return_value=cb.heartbeat * 1000 + 1)
+            cb.is_server_alive()
+        assert len(cb._rtt_pending) == cb.RTT_PENDING_MAX
+
+    def test_adaptive_heartbeat(self, cb, mocker):
+        cb.ADAPTIVE_HEARTBEAT = True
+        now = 100000
+        mocker.patch('blynklib.ticks_ms', return_value=now)
+        mocker.patch.object(cb, 'send', return_value=None)
+        cb._last_ping_time = 0
+        # idle for half of heartbeat: no ping for healthy connection
+        cb._last_rcv_time = cb._last_send_time = now - cb.heartbeat * 1000 // 2
+        cb._rtt_samples.extend([20.0, 25.0])
+        cb._rtt_min = 20.0
+        assert not cb.rtt_degraded()
+        cb.is_server_alive()
+        assert cb.send.call_count == 0
+        cb._rtt_samples.append(300.0)
+        assert cb.rtt_degraded()
+        cb.is_server_alive()
+        assert cb.send.call_count == 1
+
+    def test_receive_connection_closed(self, cb, mocker):
+        cb._socket = socket.socket()
+        mocker.patch('socket.socket.recv', return_value=b'')
+        with pytest.raises(BlynkError) as b_err:
+            cb.receive(10, 1)
+        assert 'Connection closed by server' in str(b_err.value)
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import ssl
+import pytest
+import blynklib
+from blynklib import Blynk, Protocol
+from blynklib_async import AsyncBlynk
+
+
+def make_blynk(server, token='1234', **kwargs):
+    blynk = Blynk(token, server='127.0.0.1', port=server.port, **kwargs)
+    blynk._events = {}
+    return blynk
+
+
+def hw_values(server, pin):
+    return [args[2:] for _, _, args in server.messages(Protocol.MSG_HW) if args[:2] == ['vw', str(pin)]]
+
+
+class TestBlynkE2E:
+    @pytest.fixture(autouse=True)
+    def no_dns_cache(self):
+        blynklib.Connection._dns_cache = {}
+        yield
+        blynklib.Connection._dns_cache = {}
+
+    def test_login_write_and_dispatch(self, mock_server):
+        bl = make_blynk(mock_server)
+        calls = []
+
+        @bl.handle_event('write V1')
+        def write_handler(pin, value):
+            calls.append(value)
+
+        assert bl.connect()
+        assert [msg[0] for msg in mock_server.messages()] == [Protocol.MSG_LOGIN, Protocol.MSG_INTERNAL]
+        bl.virtual_write(2, 'abc')
+        assert mock_server.wait_for(lambda: hw_values(mock_server, 2) == [['abc']], poll=bl.run)
+        mock_server.virtual_write(1, 42)
+        assert mock_server.wait_for(lambda: calls == [['42']], poll=bl.run)
+        bl.disconnect()
+
+    def test_fragmented_messages(self, mock_server):
+        bl = make_blynk(mock_server)
+        calls = []
+
+        @bl.handle_event('write V1')
+        def write_handler(pin, value):
+            calls.append(value)
+
+        assert bl.connect()
+        mock_server.fragment = 1
+        mock_server.virtual_write(1, 'first', 'value')
+        mock_server.virtual_write(1, 'second')
+        assert mock_server.wait_for(lambda: len(calls) == 2, poll=bl.run)
+        assert calls == [['first', 'value'], ['second']]
+        bl.disconnect()
+
+    def test_sync_and_bridge(self, mock_server):
+        def on_message(server, client, msg_type, msg_id, args):
+            # server answers pin sync request with stored pin value
+            if msg_type == Protocol.MSG_HW_SYNC:
+                server.virtual_write(args[1], 'stored')
+
+        mock_server.on_message = on_message
+        bl = make_blynk(mock_server)
+        calls = []
+
+        @bl.handle_event('write V*')
+        def write_handler(pin, value):
+            calls.append((pin, value))
+
+        assert bl.connect()
+        bl.virtual_sync(7)
+        mock_server.send(Protocol.MSG_BRIDGE, 'vw', 8, 'bridged')
+        assert mock_server.wait_for(lambda: len(calls) == 2, poll=bl.run)
+        assert sorted(calls) == [(7, ['stored']), (8, ['bridged'])]
+        bl.disconnect()
+
+    def test_throughput_keeps_order(self, mock_server):
+        bl = make_blynk(mock_server)
+        assert bl.connect()
+        for value in range(500):
+            bl.virtual_write(3, value)
+        assert mock_server.wait_for(lambda: len(hw_values(mock_server, 3)) == 500, poll=bl.run)
+        assert hw_values(mock_server, 3) == [[str(value)] for value in range(500)]
+        bl.disconnect()
+
+    def test_rate_limit_coalescing(self, mock_server):
+        bl = make_blynk(mock_server, rate_limit=20, rate_burst=1)
+        assert bl.connect()
+        for value in range(100):
+            bl.virtual_write(4, value)
+        assert mock_server.wait_for(lambda: ['99'] in hw_values(mock_server, 4), poll=bl.run)
+        # writes to the same pin over the limit are collapsed to the latest value
+        assert len(hw_values(mock_server, 4)) < 5
+        bl.disconnect()
+
+    def test_redirect(self, mock_server_factory):
+        target = mock_server_factory()
+        redirector = mock_server_factory(redirect=('127.0.0.1', target.port))
+        bl = make_blynk(redirector)
+        assert bl.connect(timeout=5)
+        assert redirector.messages(Protocol.MSG_LOGIN) and target.connections == 1
+        assert int(bl.port) == target.port
+        bl.disconnect()
+
+    def test_invalid_token(self, mock_server_factory):
+        server = mock_server_factory(tokens={'good'})
+        bl = make_blynk(server, token='bad')
+        assert bl.connect(timeout=0) is False
+        assert not bl.connected()
+        assert server.messages(Protocol.MSG_LOGIN)[0][2] == ['bad']
+
+    def test_ping_latency(self, mock_server_factory):
+        server = mock_server_factory(latency=0.05)
+        bl = make_blynk(server, heartbeat=0.2)
+        assert bl.connect()
+        assert server.wait_for(lambda: bl.rtt_stats() is not None, poll=bl.run)
+        assert bl.rtt_stats()['min'] >= 50
+        bl.disconnect()
+
+    def test_tls_login_with_delayed_answers(self, mock_server_factory, tls_cert):
+        # TLS 1.3 server sends session ticket after handshake, so socket becomes readable before login response
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(*tls_cert)
+        server = mock_server_factory(latency=0.05, ssl_context=context)
+        bl = make_blynk(server, ssl_cert=tls_cert[0])
+        calls = []
+
+        @bl.handle_event('write V1')
+        def write_handler(pin, value):
+            calls.append(value)
+
+        assert bl.connect(timeout=5)
+        assert server.connections == 1
+        server.virtual_write(1, 'secure')
+        assert server.wait_for(lambda: calls == [['secure']], poll=bl.run)
+        bl.disconnect()
+
+    def test_reconnect_on_dropped_pings(self, mock_server_factory):
+        server = mock_server_factory(drop={Protocol.MSG_PING: 1.0})
+        bl = make_blynk(server, heartbeat=0.2)
+        bl.RECONNECT_SLEEP = 0.01
+        assert bl.connect()
+        # server does not answer pings, so client considers it offline and connects again
+        assert server.wait_for(lambda: server.connections == 2 and bl.connected(), poll=bl.run)
+        assert server.messages(Protocol.MSG_PING)
+        bl.disconnect()
+
+    def test_reconnect_on_server_disconnect(self, mock_server):
+        bl = make_blynk(mock_server)
+        bl.RECONNECT_SLEEP = 0.01
+        assert bl.connect()
+        mock_server.disconnect_clients()
+        assert mock_server.wait_for(lambda: mock_server.connections == 2 and bl.connected(), poll=bl.run)
+        bl.disconnect()
+
+    def test_async_client(self, mock_server):
+        mock_server.fragment = 2
+        calls = []
+
+        async def scenario():
+            bl = AsyncBlynk('1234', server='127.0.0.1', port=mock_server.port)
+            bl._events = {}
+
+            @bl.handle_event('write V5')
+            def write_handler(pin, value):
+                calls.append(value)
+                bl.virtual_write(6, value[0])
+
+            run_task = asyncio.ensure_future(bl.run())
+            while not bl.connected():
+                await asyncio.sleep(0.01)
+            mock_server.virtual_write(5, 'x')
+            while not hw_values(mock_server, 6):
+                await asyncio.sleep(0.01)
+            run_task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await run_task
+            bl.disconnect()
+
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(asyncio.wait_for(scenario(), 10))
+        finally:
+            loop.close()
+        assert calls == [['x']]
+        assert hw_values(mock_server, 6) == [['x']]
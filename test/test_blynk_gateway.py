@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+import errno
+import socket
+import threading
+import time
+import pytest
+from blynklib import Protocol
+from blynkgateway import BlynkGateway, _Session
+
+
+class TestBlynkGateway:
+    @pytest.fixture
+    def server(self):
+        # minimal threaded server: accepts login and heartbeat then sends token specific write message
+        protocol = Protocol()
+        srv = socket.socket()
+        srv.bind(('127.0.0.1', 0))
+        srv.listen(8)
+        tokens = {'bad': 9}
+
+        def recv_msg(conn):
+            head = conn.recv(5, socket.MSG_WAITALL)
+            msg_len = protocol.frame_len(head)
+            body = conn.recv(msg_len - 5, socket.MSG_WAITALL) if msg_len > 5 else b''
+            return body
+
+        def handle(conn):
+            token = recv_msg(conn).decode()
+            status = tokens.get(token, 200)
+            conn.sendall(Protocol.MSG_HEAD.pack(Protocol.MSG_RSP, 1, status))
+            if status != 200:
+                conn.close()
+                return
+            recv_msg(conn)
+            conn.sendall(Protocol.MSG_HEAD.pack(Protocol.MSG_RSP, 2, 200) +
+                         protocol._pack_msg(Protocol.MSG_HW, 'vw', 1, token, msg_id=3))
+            try:
+                while conn.recv(1024):
+                    pass
+            except OSError:
+                pass
+            conn.close()
+
+        def accept():
+            while True:
+                try:
+                    conn, _ = srv.accept()
+                except OSError:
+                    return
+                threading.Thread(target=handle, args=(conn,), daemon=True).start()
+
+        threading.Thread(target=accept, daemon=True).start()
+        yield srv.getsockname()[1]
+        srv.close()
+
+    def test_sessions_dispatch_to_own_handlers(self, server):
+        gw = BlynkGateway()
+        received = {}
+        devices = []
+        for token in ('dev1', 'dev2', 'dev3'):
+            device = gw.add_device(token, server='127.0.0.1', port=server)
+            devices.append(device)
+
+            @device.handle_event('write V1')
+            def write_handler(pin, value, token=token):
+                received[token] = value[0]
+
+        end_time = time.time() + 5
+        while len(received) < 3 and time.time() < end_time:
+            gw.run()
+        assert received == {'dev1': 'dev1', 'dev2': 'dev2', 'dev3': 'dev3'}
+        assert sorted(d.token for d in gw.connected()) == ['dev1', 'dev2', 'dev3']
+        for device in devices:
+            gw.remove_device(device)
+        assert gw.devices() == []
+        assert not any(device.connected() for device in devices)
+
+    def test_invalid_token_session_reconnects(self, server):
+        gw = BlynkGateway()
+        errors = []
+        bad = gw.add_device('bad', server='127.0.0.1', port=server, log=errors.append)
+        good = gw.add_device('good', server='127.0.0.1', port=server)
+        end_time = time.time() + 5
+        while not (good.connected() and errors) and time.time() < end_time:
+            gw.run()
+        assert good.connected()
+        assert not bad.connected()
+        assert any('Invalid Auth Token' in str(err) for err in errors)
+        assert gw._sessions[bad].reconnect_at > 0
+
+    def test_run_without_devices(self):
+        gw = BlynkGateway()
+        gw.run(timeout=0.001)
+        assert gw.devices() == []
+
+    def test_start_connect_windows_would_block(self, mocker):
+        # non-blocking connect on Windows reports WSAEWOULDBLOCK instead of EINPROGRESS
+        mocker.patch.object(errno, 'WSAEWOULDBLOCK', 10035, create=True)
+        mocker.patch.object(socket.socket, 'connect_ex', return_value=10035)
+        gw = BlynkGateway()
+        device = gw.add_device('1234', server='127.0.0.1', port=8080)
+        session = gw._sessions[device]
+        gw._start_connect(session, 1000)
+        assert session.stage == _Session.TCP
+        gw.remove_device(device)
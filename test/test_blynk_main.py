@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 from __future__ import print_function
+import json
+import select
 import socket
 import pytest
 import blynklib
@@ -62,6 +64,18 @@ class TestBlynk:
         result = bl.virtual_write(20, 'va1', 'val2')
         assert result == 10
 
+    def test_virtual_write_many(self, bl, mocker):
+        mocker.patch.object(bl, 'send_all', return_value=27)
+        result = bl.virtual_write_many([(1, 10), (2, ('a', 'b'))])
+        assert result == 27
+        bl.send_all.assert_called_once_with(bytearray(b'\x14\x00\x01\x00\x07vw\x001\x0010'
+                                                      b'\x14\x00\x02\x00\x08vw\x002\x00a\x00b'))
+
+    def test_virtual_write_many_empty(self, bl, mocker):
+        mocker.patch.object(bl, 'send_all', return_value=None)
+        assert bl.virtual_write_many({}) == 0
+        assert bl.send_all.call_count == 0
+
     def test_virtual_sync(self, bl, mocker):
         mocker.patch.object(bl, 'send', return_value=20)
         result = bl.virtual_sync(20, 22)
@@ -113,8 +127,10 @@ class TestBlynk:
         def read_pin_handler():
             pass
 
-        assert 'read v10' in bl._events.keys()
-        assert len(bl._events.keys()) == bl.VPIN_MAX_NUM + 1
+        assert 'read v*' in bl._events.keys()
+        assert len(bl._events.keys()) == 1
+        assert bl._read_all_handler is read_pin_handler.func
+        assert bl._read_handlers[10] is None
 
     def test_write_wildcard_event(self, bl):
         bl._events = {}
@@ -123,8 +139,10 @@ class TestBlynk:
         def write_pin_handler():
             pass
 
-        assert 'write v5' in bl._events.keys()
-        assert len(bl._events.keys()) == bl.VPIN_MAX_NUM + 1
+        assert 'write v*' in bl._events.keys()
+        assert len(bl._events.keys()) == 1
+        assert bl._write_all_handler is write_pin_handler.func
+        assert bl._write_handlers[5] is None
 
     def test_call_handler(self, bl):
         bl._events = {}
@@ -169,6 +187,25 @@ class TestBlynk:
         bl.process(bl.MSG_HW, 100, 200, ['vw', 4, 1, 2])
         assert bl._status == 'WRITE TEST[1, 2]'
 
+    def test_handlers_get_plain_lists(self, bl):
+        received = []
+
+        @bl.handle_event('write V1')
+        def write_handler(pin, value):
+            received.append(value)
+
+        @bl.handle_event('internal_rtc')
+        def rtc_handler(value):
+            received.append(value)
+
+        bl.feed(b'\x14\x00\x01\x00\x06vw\x001\x001' + b'\x11\x00\x02\x00\x07rtc\x00123')
+        assert received == [['1'], ['123']]
+        for value in received:
+            assert type(value) is list
+            assert value + ['x'] == [value[0], 'x']
+            assert json.dumps(value) == '["{}"]'.format(value[0])
+        assert ['1'] == received[0]
+
     def test_process_read(self, bl, mocker):
         bl._events = {}
 
@@ -179,3 +216,446 @@ class TestBlynk:
         mocker.patch.object(bl, 'send', return_value=None)
         bl.process(bl.MSG_HW, 100, 200, ['vr', 7])
         assert bl._status == 'READ TEST7'
+
+    def test_feed(self, bl, mocker):
+        mocker.patch.object(bl, 'process', return_value=None)
+        bl.feed(b'\x06\x00\x01\x00\x00\x14\x00\x02\x00\x04vr\x007\x14\x00')
+        assert bl.process.call_count == 2
+        bl.feed(b'\x03\x00\x04vr\x008')
+        assert bl.process.call_count == 3
+        bl.process.assert_called_with(bl.MSG_HW, 3, 4, [u'vr', u'8'])
+
+    def test_feed_handler_error(self, bl, mocker):
+        mocker.patch.object(bl, 'log')
+        mocker.patch.object(bl, 'send', return_value=None)
+        calls = []
+
+        @bl.handle_event('write V1')
+        def write_handler(pin, value):
+            calls.append(value)
+            if value == ['1']:
+                raise ValueError('bad value')
+
+        frames = b''.join(bl._pack_msg(bl.MSG_HW, 'vw', 1, value, msg_id=value) for value in (1, 2, 3))
+        bl.feed(frames + b'\x06\x00\x04\x00\x00')
+        # failed handler does not drop the rest of coalesced frames
+        assert calls == [['1'], ['2'], ['3']]
+        bl.send.assert_called_once_with(bl.response_msg(bl.STATUS_OK, msg_id=4))
+        bl.log.assert_any_call('Message processing error: bad value')
+        assert bl._rx_buffer == b''
+
+    def test_handle_event_dispatch_tables(self, bl):
+        @bl.handle_event('write V3')
+        def write_handler(pin, value):
+            pass
+
+        @bl.handle_event('read v5')
+        def read_handler(pin):
+            pass
+
+        @bl.handle_event('internal_rtc')
+        def rtc_handler(value):
+            pass
+
+        assert bl._write_handlers[3] is write_handler.func
+        assert bl._read_handlers[5] is read_handler.func
+        assert bl._internal_handlers['rtc'] is rtc_handler.func
+        assert bl._write_handlers[5] is None
+
+    def test_handlers_per_instance(self, bl):
+        other = blynklib.Blynk('5678')
+
+        @bl.handle_event('write V1')
+        def write_handler(pin, value):
+            pass
+
+        assert 'write v1' in bl._events
+        assert 'write v1' not in other._events
+        assert other._write_handlers[1] is None
+
+    def test_process_write_wildcard_fallback(self, bl):
+        calls = []
+
+        @bl.handle_event('write V*')
+        def write_all_handler(pin, value):
+            calls.append(('all', pin, value))
+
+        @bl.handle_event('write V200')
+        def write_handler(pin, value):
+            calls.append(('own', pin, value))
+
+        bl.process(bl.MSG_HW, 100, 200, ['vw', '200', '1'])
+        bl.process(bl.MSG_HW, 100, 200, ['vw', '255', '2'])
+        bl.process(bl.MSG_HW, 100, 200, ['vw', '300', '3'])
+        assert calls == [('own', 200, ['1']), ('all', 255, ['2']), ('all', 300, ['3'])]
+
+    def test_process_read_wildcard_fallback(self, bl):
+        calls = []
+
+        @bl.handle_event('read V*')
+        def read_all_handler(pin):
+            calls.append(pin)
+
+        bl.process(bl.MSG_HW, 100, 200, ['vr', '128'])
+        bl.call_handler('read v7', 7)
+        assert calls == [128, 7]
+
+    def test_process_write_pin_out_of_range(self, bl, mocker):
+        mocker.spy(bl, '_run_handler')
+        bl.process(bl.MSG_HW, 100, 200, ['vw', bl.VPIN_MAX_NUM + 1, 1])
+        bl.process(bl.MSG_HW, 100, 200, ['vw', -1, 1])
+        assert bl._run_handler.call_count == 0
+
+    def test_process_read_no_handler(self, mocker):
+        bl = blynklib.Blynk('1234')
+        mocker.spy(bl, '_run_handler')
+        bl.process(bl.MSG_HW, 100, 200, ['vr', 3])
+        assert bl._run_handler.call_count == 0
+
+    def test_wait_response(self, bl, mocker):
+        bl._socket = socket.socket()
+        mocker.patch('select.select', return_value=([bl._socket], [], []))
+        mocker.patch.object(bl, 'receive', return_value=b'\x14\x00\x02\x00\x04vr\x007')
+        mocker.patch.object(bl, 'process', return_value=None)
+        bl.wait_response(0.5)
+        select.select.assert_called_once_with([bl._socket], [], [], 0.5)
+        bl.process.assert_called_once_with(bl.MSG_HW, 2, 4, ['vr', '7'])
+
+    def test_wait_response_timeout(self, bl, mocker):
+        bl._socket = socket.socket()
+        mocker.patch('select.select', return_value=([], [], []))
+        mocker.patch.object(bl, 'receive', return_value=b'')
+        bl.wait_response(0.5)
+        assert bl.receive.call_count == 0
+
+    def test_run_with_timer(self, bl, mocker):
+        timer = mocker.Mock()
+        timer.next_timeout.return_value = 0.2
+        timer.running_jobs.return_value = 0
+        bl._state = bl.AUTHENTICATED
+        mocker.patch.object(bl, 'wait_response', return_value=None)
+        mocker.patch.object(bl, 'is_server_alive', return_value=True)
+        bl.run(timer)
+        bl.wait_response.assert_called_once_with(0.2)
+        assert timer.fire.call_count == 1
+
+    def test_run_with_timer_heartbeat_limit(self, bl, mocker):
+        timer = mocker.Mock()
+        timer.next_timeout.return_value = None
+        timer.running_jobs.return_value = 0
+        bl._state = bl.AUTHENTICATED
+        mocker.patch.object(bl, 'wait_response', return_value=None)
+        mocker.patch.object(bl, 'is_server_alive', return_value=True)
+        bl.run(timer)
+        bl.wait_response.assert_called_once_with(bl.heartbeat / 10.0)
+
+    def test_blocking_handler_runs_in_thread_pool(self, bl, mocker):
+        threads = []
+        bl._state = bl.AUTHENTICATED
+        mocker.patch.object(bl, 'read_response', return_value=None)
+        mocker.patch.object(bl, 'is_server_alive', return_value=True)
+        mocker.patch.object(bl, 'send_all', return_value=None)
+
+        @bl.handle_event('read v1', blocking=True)
+        def read_handler(pin):
+            threads.append(blynklib.get_ident())
+            bl.virtual_write(pin, 10)
+
+        bl.run()
+        job = bl.call_handler('read v1', 1)
+        job.result(timeout=1)
+        assert threads[0] != blynklib.get_ident()
+        # data sent from worker thread is written to socket by io loop thread
+        assert bl.send_all.call_count == 0
+        bl.run()
+        bl.send_all.assert_called_once_with(bytearray(bl._pack_msg(bl.MSG_HW, 'vw', 1, 10, msg_id=1)))
+
+    def test_blocking_handler_error_logged(self, bl, mocker):
+        mocker.patch.object(bl, 'log')
+
+        @bl.handle_event('write v2', blocking=True)
+        def write_handler(pin, value):
+            raise ValueError('sensor error')
+
+        job = bl.call_handler('write v2', 2, ['1'])
+        with pytest.raises(ValueError):
+            job.result(timeout=1)
+        bl._executor.shutdown(wait=True)
+        assert not bl._jobs
+        bl.log.assert_called_with('Event handler error: sensor error')
+
+    def test_run_with_running_jobs(self, bl, mocker):
+        timer = mocker.Mock()
+        timer.next_timeout.return_value = None
+        timer.running_jobs.return_value = 1
+        bl._state = bl.AUTHENTICATED
+        mocker.patch.object(bl, 'wait_response', return_value=None)
+        mocker.patch.object(bl, 'is_server_alive', return_value=True)
+        bl.run(timer)
+        bl.wait_response.assert_called_once_with(bl.SOCK_TIMEOUT)
+
+    def test_rate_limit_coalesce(self, mocker):
+        clock = [1000]
+        mocker.patch('blynklib.ticks_ms', side_effect=lambda: clock[0])
+        bl = blynklib.Blynk('1234', rate_limit=10, rate_burst=2)
+        mocker.patch.object(bl, 'send', return_value=None)
+        mocker.patch.object(bl, 'send_all', return_value=None)
+        for value in range(5):
+            bl.virtual_write(1, value)
+        bl.virtual_write(2, 'a')
+        bl.notify('n')
+        assert bl.send.call_count == 2
+        # writes to the same pin are collapsed to the latest value
+        assert list(bl._tx_pending.values()) == [bl._pack_msg(bl.MSG_HW, 'vw', 1, 4, msg_id=5),
+                                                 bl._pack_msg(bl.MSG_HW, 'vw', 2, 'a', msg_id=6),
+                                                 bl._pack_msg(bl.MSG_NOTIFY, 'n', msg_id=7)]
+        assert bl.tx_delay() == pytest.approx(0.1)
+        bl.flush_tx_queue()
+        assert bl.send_all.call_count == 0
+        clock[0] += 200
+        assert bl.tx_delay() == 0
+        bl.flush_tx_queue()
+        bl.send_all.assert_called_once_with(bytearray(bl._pack_msg(bl.MSG_HW, 'vw', 1, 4, msg_id=5) +
+                                                      bl._pack_msg(bl.MSG_HW, 'vw', 2, 'a', msg_id=6)))
+        assert len(bl._tx_pending) == 1
+
+    def test_rate_limit_virtual_write_many(self, mocker):
+        bl = blynklib.Blynk('1234', rate_limit=1)
+        mocker.patch.object(bl, 'send', return_value=12)
+        mocker.patch.object(bl, 'send_all', return_value=None)
+        # collapsed and delayed writes are counted as accepted
+        assert bl.virtual_write_many([(1, 10), (2, 20), (2, 30)]) == 36
+        assert bl.send.call_count == 1
+        assert bl.send_all.call_count == 0
+        assert list(bl._tx_pending.keys()) == [('vw', '2')]
+
+    def test_rate_limit_virtual_write_many_batch(self, mocker):
+        mocker.patch('blynklib.ticks_ms', return_value=1000)
+        bl = blynklib.Blynk('1234', rate_limit=1, rate_burst=2)
+        sent = []
+        bl._socket = mocker.Mock()
+        bl._socket.send.side_effect = lambda data: sent.append(bytes(data)) or len(data)
+        assert bl.virtual_write_many([(1, 10), (2, 20), (3, 30)]) == 36
+        # messages allowed by rate limiter are written with one syscall
+        assert sent == [bl._pack_msg(bl.MSG_HW, 'vw', 1, 10, msg_id=1) + bl._pack_msg(bl.MSG_HW, 'vw', 2, 20, msg_id=2)]
+        assert list(bl._tx_pending.values()) == [bl._pack_msg(bl.MSG_HW, 'vw', 3, 30, msg_id=3)]
+
+    def test_rate_limit_batch(self, mocker):
+        clock = [1000]
+        mocker.patch('blynklib.ticks_ms', side_effect=lambda: clock[0])
+        bl = blynklib.Blynk('1234', rate_limit=1, rate_burst=2)
+        mocker.patch.object(bl, 'send_all', return_value=None)
+        sent = []
+        bl._socket = mocker.Mock()
+        bl._socket.send.side_effect = lambda data: sent.append(bytes(data)) or len(data)
+        bl.virtual_write(1, 'a')
+        bl.virtual_write(2, 'a')
+        bl.virtual_write(1, 'b')
+        assert sent == [bl._pack_msg(bl.MSG_HW, 'vw', 1, 'a', msg_id=1),
+                        bl._pack_msg(bl.MSG_HW, 'vw', 2, 'a', msg_id=2)]
+        with bl.batch():
+            # newer value replaces queued one instead of overtaking it
+            bl.virtual_write(1, 'c')
+        assert list(bl._tx_pending.values()) == [bl._pack_msg(bl.MSG_HW, 'vw', 1, 'c', msg_id=4)]
+        clock[0] += 3000
+        bl.flush_tx_queue()
+        bl.send_all.assert_called_once_with(bytearray(bl._pack_msg(bl.MSG_HW, 'vw', 1, 'c', msg_id=4)))
+        clock[0] += 3000
+        with bl.batch():
+            for pin in range(3, 6):
+                bl.virtual_write(pin, 'x')
+        # batch does not exceed rate_burst, the rest waits for tokens
+        assert bl.send_all.call_args[0][0] == bytearray(bl._pack_msg(bl.MSG_HW, 'vw', 3, 'x', msg_id=5) +
+                                                        bl._pack_msg(bl.MSG_HW, 'vw', 4, 'x', msg_id=6))
+        assert list(bl._tx_pending.values()) == [bl._pack_msg(bl.MSG_HW, 'vw', 5, 'x', msg_id=7)]
+
+    def test_run_with_pending_messages(self, mocker):
+        bl = blynklib.Blynk('1234', rate_limit=4, rate_burst=1)
+        timer = mocker.Mock()
+        timer.next_timeout.return_value = None
+        timer.running_jobs.return_value = 0
+        bl._state = bl.AUTHENTICATED
+        mocker.patch.object(bl, 'send', return_value=None)
+        mocker.patch.object(bl, 'wait_response', return_value=None)
+        mocker.patch.object(bl, 'is_server_alive', return_value=True)
+        mocker.patch('blynklib.ticks_ms', return_value=1000)
+        bl._tokens_time = 1000
+        bl.virtual_write(1, 1)
+        bl.virtual_write(1, 2)
+        bl.run(timer)
+        bl.wait_response.assert_called_once_with(0.25)
+
+    def test_offline_store_replay(self, tmp_path, mocker):
+        from blynkstore import OfflineStore
+        clock = [1000]
+        mocker.patch('blynklib.ticks_ms', side_effect=lambda: clock[0])
+        store = OfflineStore(str(tmp_path / 'blynk.store'), size=256)
+        bl = blynklib.Blynk('1234', offline_store=store, rate_burst=2)
+        mocker.patch.object(bl, 'send', return_value=None)
+        mocker.patch.object(bl, 'send_all', return_value=None)
+        for pin in range(3):
+            bl.virtual_write(pin, pin * 10)
+        assert bl.send.call_count == 0
+        assert len(store) == 3
+        bl._state = bl.AUTHENTICATED
+        # messages sent during replay are stored after older ones
+        bl.virtual_write(3, 30)
+        assert len(store) == 4
+        bl.flush_tx_queue()
+        bl.send_all.assert_called_once_with(bytearray(bl._pack_msg(bl.MSG_HW, 'vw', 0, 0, msg_id=5) +
+                                                      bl._pack_msg(bl.MSG_HW, 'vw', 1, 10, msg_id=6)))
+        assert len(store) == 2
+        assert bl.tx_delay() == 0
+        # rest of stored messages wait for rate limit tokens
+        bl.flush_tx_queue()
+        assert bl.send_all.call_count == 1
+        assert len(bl._tx_pending) == 2
+        assert bl.tx_delay() == pytest.approx(1.0 / bl.REPLAY_RATE_LIMIT)
+        clock[0] += 1000
+        bl.flush_tx_queue()
+        assert bl.send_all.call_args[0][0] == bytearray(bl._pack_msg(bl.MSG_HW, 'vw', 2, 20, msg_id=7) +
+                                                        bl._pack_msg(bl.MSG_HW, 'vw', 3, 30, msg_id=8))
+        assert len(store) == 0
+        clock[0] += 100
+        bl.virtual_write(4, 40)
+        bl.send.assert_called_once_with(bl._pack_msg(bl.MSG_HW, 'vw', 4, 40, msg_id=9))
+        store.close()
+
+    def test_offline_store_keeps_unsent(self, tmp_path, mocker):
+        from blynkstore import OfflineStore
+        store = OfflineStore(str(tmp_path / 'blynk.store'), size=256)
+        bl = blynklib.Blynk('1234', offline_store=store, rate_limit=1)
+        bl._state = bl.AUTHENTICATED
+        mocker.patch.object(bl, 'send', return_value=12)
+        assert bl.virtual_write(1, 10) == 12
+        assert bl.virtual_write(2, 20) == 12
+        assert len(bl._tx_pending) == 1
+        bl._close_connection()
+        assert not bl._tx_pending
+        assert store.get() == bl._pack_msg(bl.MSG_HW, 'vw', 2, 20, msg_id=2)
+        store.close()
+
+    def test_offline_store_order_across_reconnect(self, tmp_path, mocker):
+        from blynkstore import OfflineStore
+        clock = [1000]
+        mocker.patch('blynklib.ticks_ms', side_effect=lambda: clock[0])
+        store = OfflineStore(str(tmp_path / 'blynk.store'), size=256)
+        bl = blynklib.Blynk('1234', offline_store=store, rate_limit=1, rate_burst=2)
+        mocker.patch.object(bl, 'send_all', return_value=None)
+        for value in range(3):
+            bl.virtual_write(1, value)
+        bl._state = bl.AUTHENTICATED
+        bl._tokens = 0
+        # replay moves the oldest messages to pending queue, while new write is stored after the rest
+        bl.flush_tx_queue()
+        assert len(bl._tx_pending) == 2
+        bl.virtual_write(1, 3)
+        bl._close_connection()
+        values = []
+        while store:
+            values.append(bytes(store.get()).split(b'\0')[-1])
+        assert values == [b'0', b'1', b'2', b'3']
+        store.close()
+
+    def test_wait_response_flushes_tx_buffer(self, bl, mocker):
+        bl._socket = socket.socket()
+        bl._tx_buffer = bytearray(b'1234')
+        mocker.patch('select.select', return_value=([], [bl._socket], []))
+        mocker.patch('socket.socket.send', return_value=4)
+        bl.wait_response(0.5)
+        select.select.assert_called_once_with([bl._socket], [bl._socket], [], 0.5)
+        assert bl.tx_buffered() == 0
+
+    def test_connect_waits_backoff(self, bl, mocker):
+        mocker.patch.object(bl, '_get_socket', side_effect=[blynklib.BlynkError('offline')] * 2 + [None])
+        mocker.patch.object(bl, '_authenticate', return_value=None)
+        mocker.patch.object(bl, '_set_heartbeat', return_value=None)
+        mocker.patch('random.uniform', return_value=0.5)
+        sleep = mocker.patch('time.sleep', return_value=None)
+        assert bl.connect(10) is True
+        # every failed attempt is followed by backoff wait
+        assert sleep.call_count == 2
+        assert all(call[0][0] == pytest.approx(0.5, abs=0.05) for call in sleep.call_args_list)
+        assert bl._reconnect_attempt == 0
+
+    def test_connect_backoff_longer_than_timeout(self, bl, mocker):
+        bl._reconnect_at = blynklib.ticks_ms() + 5000
+        mocker.patch.object(bl, '_get_socket', return_value=None)
+        mocker.patch('time.sleep', return_value=None)
+        assert bl.connect(1) is False
+        assert bl._get_socket.call_count == 0
+
+    def test_run_reconnect_nonblocking(self, mocker):
+        bl = blynklib.Blynk('1234', reconnect_nonblocking=True)
+        mocker.patch.object(bl, 'connect', return_value=False)
+        sleep = mocker.patch('time.sleep', return_value=None)
+        bl._reconnect_at = blynklib.ticks_ms() + 5000
+        bl.run()
+        assert bl.connect.call_count == 0
+        # loop without timer waits SOCK_TIMEOUT instead of spinning till reconnect time
+        sleep.assert_called_once_with(bl.SOCK_TIMEOUT)
+        bl._reconnect_at = 0
+        bl.run()
+        bl.connect.assert_called_once_with(timeout=0)
+
+    def test_process_rsp_rtt(self, bl, mocker):
+        bl._rtt_pending[7] = 0
+        mocker.patch.object(bl, '_rtt_response')
+        bl.process(bl.MSG_RSP, 7, 200, [])
+        bl._rtt_response.assert_called_once_with(7)
+
+    def test_profile_handlers(self, mocker):
+        bl = blynklib.Blynk('1234', profile=True)
+        mocker.patch.object(bl, 'log')
+        mocker.patch('time.time', side_effect=[10.0, 10.01, 20.0, 20.5, 30.0, 30.02])
+
+        @bl.handle_event('write V1')
+        def write_handler(pin, value):
+            pass
+
+        @bl.handle_event('read V2')
+        def read_handler(pin):
+            pass
+
+        bl.call_handler('write v1', 1, ['1'])
+        bl.call_handler('read v2', 2)
+        bl.call_handler('write v1', 1, ['2'])
+        stats = bl.profile_stats()
+        assert [item[:2] for item in stats] == [('read v2', 1), ('write v1', 2)]
+        assert stats[0][2:] == pytest.approx((500, 500))
+        assert stats[1][2:] == pytest.approx((30, 20))
+        # only handler exceeding SLOW_HANDLER_MS is reported
+        warnings = [c[0][0] for c in bl.log.call_args_list if c[0][0].startswith('[WARNING]')]
+        assert warnings == ["[WARNING] Slow handler: ['read v2'] took 500.0 ms"]
+
+    def test_log_profile(self, mocker):
+        bl = blynklib.Blynk('1234', profile=True)
+        bl._profile = {'write v1': [2, 30.0, 20.0]}
+        timer = mocker.Mock()
+        timer.profile_stats.return_value = [('0_func', 5, 12.5, 3.0)]
+        mocker.patch.object(bl, 'log')
+        bl.log_profile(timer)
+        lines = [c[0][0] for c in bl.log.call_args_list]
+        assert len(lines) == 4
+        assert lines[1].split() == ['write', 'v1', '2', '30.0', '20.0']
+        assert lines[3].split() == ['0_func', '5', '12.5', '3.0']
+
+    def test_profile_disabled(self, bl):
+        bl.call_handler('write v1', 1, ['1'])
+        assert bl._profile is None
+        assert bl.profile_stats() == []
+
+    def test_log_level(self, mocker):
+        log = mocker.Mock()
+        bl = blynklib.Blynk('1234', log=log, log_level=blynklib.LOG_INFO)
+        bl.process(bl.MSG_RSP, 1, 200, [])
+        bl._log(blynklib.LOG_INFO, 'Heartbeat = {} sec', 10)
+        log.assert_called_once_with('Heartbeat = 10 sec')
+
+    def test_log_disabled_not_formatted(self, bl):
+        class Arg(object):
+            def __format__(self, spec):
+                raise AssertionError('formatted')
+
+        bl.log = blynklib.stub_log
+        bl._log(blynklib.LOG_ERROR, '{}', Arg())
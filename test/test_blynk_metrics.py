@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+import socket
+import pytest
+import blynklib
+import blynkmetrics
+import blynktimer
+from blynkmetrics import Registry, MetricsServer
+
+try:
+    from urllib.request import urlopen
+except ImportError:
+    from urllib2 import urlopen
+
+
+class TestMetrics:
+    @pytest.fixture
+    def reg(self):
+        yield Registry()
+
+    @pytest.fixture
+    def bl(self, reg):
+        blynk = blynklib.Blynk('1234', metrics=reg)
+        yield blynk
+
+    def test_exposition_format(self):
+        reg = Registry(labels={'device': 'kitchen'}, metrics=(
+            ('blynk_tx_bytes_total', blynkmetrics.COUNTER, 'Bytes', None),
+            ('blynk_ping_rtt_seconds', blynkmetrics.HISTOGRAM, 'RTT', (0.01, 0.1)),
+        ))
+        reg.inc('blynk_tx_bytes_total', 10)
+        for value in (0.005, 0.01, 0.05, 1):
+            reg.observe('blynk_ping_rtt_seconds', value)
+        assert reg.exposition().splitlines() == [
+            '# HELP blynk_ping_rtt_seconds RTT',
+            '# TYPE blynk_ping_rtt_seconds histogram',
+            'blynk_ping_rtt_seconds_bucket{device="kitchen",le="0.01"} 2',
+            'blynk_ping_rtt_seconds_bucket{device="kitchen",le="0.1"} 3',
+            'blynk_ping_rtt_seconds_bucket{device="kitchen",le="+Inf"} 4',
+            'blynk_ping_rtt_seconds_sum{device="kitchen"} 1.065',
+            'blynk_ping_rtt_seconds_count{device="kitchen"} 4',
+            '# HELP blynk_tx_bytes_total Bytes',
+            '# TYPE blynk_tx_bytes_total counter',
+            'blynk_tx_bytes_total{device="kitchen"} 10',
+        ]
+
+    def test_exposition_many_registries(self):
+        regs = [Registry(labels={'device': name}) for name in ('a', 'b')]
+        regs[1].set('blynk_connected', 1)
+        lines = blynkmetrics.exposition(*regs).splitlines()
+        assert lines.count('# TYPE blynk_connected gauge') == 1
+        assert 'blynk_connected{device="a"} 0' in lines
+        assert 'blynk_connected{device="b"} 1' in lines
+
+    def test_write_file(self, reg, tmp_path):
+        path = str(tmp_path / 'blynk.prom')
+        reg.inc('blynk_connects_total')
+        blynkmetrics.write_file(path, reg)
+        with open(path) as prom_file:
+            assert 'blynk_connects_total 1\n' in prom_file.read()
+        assert [p.name for p in tmp_path.iterdir()] == ['blynk.prom']
+
+    def test_metrics_server(self, reg):
+        reg.inc('blynk_events_total', 3)
+        server = MetricsServer([reg], port=0).start()
+        try:
+            body = urlopen('http://127.0.0.1:{}/metrics'.format(server.port), timeout=5).read().decode()
+        finally:
+            server.stop()
+        assert 'blynk_events_total 3\n' in body
+
+    def test_tx_metrics(self, bl, reg, mocker):
+        bl._socket = mocker.Mock()
+        bl._socket.send.side_effect = [4, socket.timeout(), 3]
+        bl.send(bl.ping_msg())
+        bl.send(b'1234')
+        assert reg.get('blynk_tx_frames_total').value == 1
+        assert reg.get('blynk_tx_bytes_total').value == 4
+        assert reg.get('blynk_tx_partial_writes_total').value == 2
+        assert reg.get('blynk_tx_buffered_bytes').value == 5
+        bl._flush_socket()
+        assert reg.get('blynk_tx_bytes_total').value == 7
+
+    def test_tx_error_metric(self, bl, reg, mocker):
+        bl._socket = mocker.Mock()
+        bl._socket.send.side_effect = OSError(32, 'Broken pipe')
+        assert bl.send(b'1234') is None
+        assert reg.get('blynk_tx_errors_total').value == 1
+        assert reg.get('blynk_tx_buffered_bytes').value == 0
+
+    def test_coalesced_metric(self, reg, mocker):
+        blynk = blynklib.Blynk('1234', rate_limit=1, rate_burst=1, metrics=reg)
+        mocker.patch.object(blynk, 'connected', return_value=True)
+        mocker.patch.object(blynk, 'send', return_value=1)
+        for value in range(3):
+            blynk.virtual_write(1, value)
+        assert reg.get('blynk_tx_coalesced_total').value == 1
+
+    def test_rx_metrics(self, bl, reg):
+        frames = bl.read_frames(bl.ping_msg(msg_id=1) + bl.ping_msg(msg_id=2)[:3])
+        assert len(frames) == 1
+        assert reg.get('blynk_rx_frames_total').value == 1
+        assert reg.get('blynk_rx_bytes_total').value == 8
+        with pytest.raises(blynklib.BlynkError):
+            bl.read_frames(b'\x14\x00\x03\xff\xff')
+        assert reg.get('blynk_rx_parse_errors_total').value == 1
+
+    def test_connection_metrics(self, bl, reg, mocker):
+        mocker.patch.object(bl, '_get_socket', return_value=None)
+        mocker.patch.object(bl, '_authenticate', return_value=None)
+        mocker.patch.object(bl, '_set_heartbeat', return_value=None)
+        assert bl.connect() is True
+        assert reg.get('blynk_connects_total').value == 1
+        assert reg.get('blynk_connected').value == 1
+        bl.disconnect()
+        assert reg.get('blynk_disconnects_total').value == 1
+        assert reg.get('blynk_connected').value == 0
+
+    def test_connect_failure_metric(self, bl, reg, mocker):
+        mocker.patch.object(bl, '_get_socket', side_effect=blynklib.BlynkError('refused'))
+        mocker.patch.object(blynklib, 'sleep_ms')
+        bl.connect(timeout=0)
+        assert reg.get('blynk_connect_failures_total').value == 1
+
+    def test_handler_metrics(self, bl, reg):
+        @bl.handle_event('write V1')
+        def write_handler(pin, value):
+            if value == ['err']:
+                raise ValueError(value)
+
+        bl.process(bl.MSG_HW, 1, 0, ['vw', '1', 'ok'])
+        with pytest.raises(ValueError):
+            bl.process(bl.MSG_HW, 2, 0, ['vw', '1', 'err'])
+        assert reg.get('blynk_events_total').value == 2
+        assert reg.get('blynk_handler_errors_total').value == 1
+        assert reg.get('blynk_handler_seconds').value == 2
+
+    def test_ping_rtt_metric(self, bl, reg, mocker):
+        bl._rtt_pending[5] = 100.0
+        mocker.patch('blynklib.monotonic', return_value=100.02)
+        bl._rtt_response(5)
+        metric = reg.get('blynk_ping_rtt_seconds')
+        assert metric.value == 1
+        assert metric.sum == pytest.approx(0.02)
+
+    def test_timer_metrics(self, reg, mocker):
+        clock = [1000.0]
+        mocker.patch.object(blynktimer, 'monotonic', side_effect=lambda: clock[0])
+        mocker.patch.object(blynktimer, 'polling_wait', side_effect=lambda sec: clock.__setitem__(0, clock[0] + sec + 0.1))
+        blynktimer.Timer.timers = {}
+        blynktimer.Timer._queue = []
+        blynktimer.Timer._unscheduled = []
+        timer = blynktimer.Timer(max_wait=None, metrics=reg)
+
+        @timer.register(interval=1)
+        def func():
+            clock[0] += 0.2
+
+        try:
+            timer.run()
+            timer.run()
+        finally:
+            blynktimer.Timer.timers = {}
+            blynktimer.Timer._queue = []
+            blynktimer.Timer._unscheduled = []
+        assert reg.get('blynk_timer_runs_total').value == 2
+        assert reg.get('blynk_timer_seconds').sum == pytest.approx(0.4)
+        assert reg.get('blynk_timer_lag_seconds').sum == pytest.approx(0.2)
@@ -25,11 +25,29 @@ class TestBlynkProtocol:
         msg_id = pb._get_msg_id()
         assert msg_id == 1
 
+    def test_get_msg_id_keeps_wrapping(self, pb):
+        pb._msg_id = 0xFFFE
+        assert [pb._get_msg_id() for _ in range(4)] == [0xFFFF, 1, 2, 3]
+
     def test_get_msg_id_defined(self, pb):
         pb._msg_id = 0xFFFF
         msg_id = pb._get_msg_id(msg_id=17)
         assert msg_id == 17
 
+    def test_get_msg_id_threads(self, pb):
+        import threading
+        ids = []
+
+        def take_ids():
+            ids.extend([pb._get_msg_id() for _ in range(5000)])
+
+        workers = [threading.Thread(target=take_ids) for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        assert sorted(ids) == list(range(1, 20001))
+
     def test_pack_msg(self, pb):
         msg_type = 20
         args = ['test', 1234, 745, 'abcde']
@@ -51,6 +69,20 @@ class TestBlynkProtocol:
         result = pb._pack_msg(msg_type, *args)
         assert result == b'\x14\x00\x01\x00\x04\xd1\x91\xd0\xb6'
 
+    def test_pack_into(self, pb):
+        buff = bytearray(b'\xff')
+        assert pb._pack_into(buff, 6) == 5
+        assert pb._pack_into(buff, 20, 'vw', 1, 2) == 11
+        assert buff == b'\xff\x06\x00\x01\x00\x00\x14\x00\x02\x00\x06vw\x001\x002'
+
+    def test_pack_into_unicode(self, pb):
+        if sys.version_info[0] == 2:
+            pytest.skip('Python2 unicode compatibility issue')
+
+        buff = bytearray()
+        pb._pack_into(buff, 20, 'ёж', msg_id=3)
+        assert buff == b'\x14\x00\x03\x00\x04\xd1\x91\xd0\xb6'
+
     def test_parse_response_msg_hw(self, pb):
         data = b'\x14\x00\x02\x00\x13test\x001234\x00745\x00abcde'
         msg_buffer = 1024
@@ -97,6 +129,45 @@ class TestBlynkProtocol:
         result = pb.parse_response(data, msg_buffer)
         assert result == (20, 2, 4, [u'ёж'])
 
+    def test_parse_frame_msg_hw(self, pb):
+        data = memoryview(b'\x06\x00\x01\x00\x00\x14\x00\x02\x00\x13test\x001234\x00745\x00abcde')
+        msg_type, msg_id, h_data, msg_args, msg_len = pb.parse_frame(data, 5, 1024)
+        assert (msg_type, msg_id, h_data, msg_len) == (20, 2, 19, 24)
+        assert msg_args == [u'test', u'1234', u'745', u'abcde']
+
+    def test_parse_frame_msg_rsp(self, pb):
+        data = memoryview(b'\x00\x00\x02\x00\xc8')
+        assert pb.parse_frame(data, 0, 1024) == (0, 2, 200, [], 5)
+
+    def test_parse_frame_incomplete(self, pb):
+        data = memoryview(b'\x14\x00\x02\x00\x13test')
+        assert pb.parse_frame(data, 0, 1024) is None
+        assert pb.parse_frame(data, 6, 1024) is None
+
+    def test_parse_frame_msg_id_0(self, pb):
+        data = memoryview(b'\x14\x00\x00\x00\x13test')
+        with pytest.raises(BlynkError) as b_err:
+            pb.parse_frame(data, 0, 1024)
+        assert 'invalid msg_id == 0' == str(b_err.value)
+
+    def test_parse_frame_wrong_msg_type(self, pb):
+        data = memoryview(b'\x86\x00\x04\x00\x01a')
+        with pytest.raises(BlynkError) as b_err:
+            pb.parse_frame(data, 0, 1024)
+        assert "Unknown message type: '134'" in str(b_err.value)
+
+    def test_frame_len_msg_hw(self, pb):
+        data = b'\x14\x00\x02\x00\x13test\x001234\x00745\x00abcde'
+        assert pb.frame_len(data) == 24
+
+    def test_frame_len_msg_rsp(self, pb):
+        data = b'\x00\x00\x02\x00\xc8\x06\x00\x03\x00\x00'
+        assert pb.frame_len(data) == 5
+        assert pb.frame_len(data, 5) == 5
+
+    def test_frame_len_incomplete_header(self, pb):
+        assert pb.frame_len(b'\x14\x00\x02') == 0
+
     def test_heartbeat_msg(self, pb):
         result = pb.heartbeat_msg(20, 2048)
         assert result == b'\x11\x00\x01\x00+ver\x000.2.6\x00buff-in\x002048\x00h-beat\x0020\x00dev\x00python'
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import pytest
+from blynkstore import OfflineStore
+
+
+class TestOfflineStore:
+    @pytest.fixture
+    def path(self, tmp_path):
+        yield str(tmp_path / 'blynk.store')
+
+    def test_put_get(self, path):
+        store = OfflineStore(path, size=128)
+        assert len(store) == 0
+        assert store.get() is None
+        assert store.put(b'first')
+        assert store.put(b'second')
+        assert len(store) == 2
+        assert store.get() == b'first'
+        assert store.get() == b'second'
+        assert store.get() is None
+        store.close()
+
+    def test_wrap_around(self, path):
+        # data region size is 128 - 20 bytes header
+        store = OfflineStore(path, size=128)
+        for idx in range(20):
+            msg = 'message {}'.format(idx).encode() * 3
+            assert store.put(msg)
+            assert store.get() == msg
+        assert len(store) == 0
+        store.close()
+
+    def test_overflow_drops_oldest(self, path):
+        store = OfflineStore(path, size=64)
+        for idx in range(10):
+            store.put(b'msg-' + str(idx).encode())
+        # 44 bytes of data region fit 6 records of 2 + 5 bytes
+        assert len(store) == 6
+        assert store.dropped == 4
+        assert [store.get() for _ in range(6)] == [b'msg-' + str(idx).encode() for idx in range(4, 10)]
+        store.close()
+
+    def test_too_large_message(self, path):
+        store = OfflineStore(path, size=64)
+        assert not store.put(b'x' * 64)
+        assert len(store) == 0
+        store.close()
+
+    def test_persisted(self, path):
+        store = OfflineStore(path, size=128)
+        store.put(b'one')
+        store.put(b'two')
+        store.get()
+        store.close()
+        store = OfflineStore(path, size=128)
+        assert len(store) == 1
+        assert store.get() == b'two'
+        store.close()
+
+    def test_size_change_resets_store(self, path):
+        store = OfflineStore(path, size=128)
+        store.put(b'one')
+        store.close()
+        store = OfflineStore(path, size=256)
+        assert len(store) == 0
+        store.close()
+
+    def test_put_front(self, path):
+        store = OfflineStore(path, size=64)
+        store.put(b'second')
+        # head is at the start of data region, so inserted record wraps around its end
+        assert store.put_front(b'first')
+        assert store.put(b'third')
+        assert [store.get() for _ in range(3)] == [b'first', b'second', b'third']
+        store.close()
+
+    def test_put_front_full(self, path):
+        store = OfflineStore(path, size=64)
+        for idx in range(6):
+            store.put(b'msg-' + str(idx).encode())
+        # inserted message is the oldest one, so it is the one dropped
+        assert not store.put_front(b'msg-x')
+        assert store.dropped == 1
+        assert store.get() == b'msg-0'
+        store.close()
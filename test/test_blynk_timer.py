@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+import pytest
+import blynktimer
+from blynktimer import Timer, TimerError
+
+
+class TestBlynkTimer:
+    @pytest.fixture
+    def clock(self, mocker):
+        class Clock(object):
+            now = 1000.0
+
+            def wait(self, sec):
+                self.now += sec
+
+        clock = Clock()
+        mocker.patch.object(blynktimer, 'monotonic', side_effect=lambda: clock.now)
+        mocker.patch.object(blynktimer, 'polling_wait', side_effect=clock.wait)
+        yield clock
+
+    @pytest.fixture
+    def tm(self, clock):
+        Timer.timers = {}
+        Timer._queue = []
+        Timer._unscheduled = []
+        timer = Timer(max_wait=None)
+        yield timer
+        if Timer._executor is not None:
+            Timer._executor.shutdown(wait=True)
+            Timer._executor = None
+        Timer.timers = {}
+        Timer._queue = []
+        Timer._unscheduled = []
+
+    def test_run_waits_till_earliest_deadline(self, tm, clock):
+        calls = []
+
+        @tm.register('a', interval=3)
+        @tm.register('b', interval=2)
+        def func(name):
+            calls.append((name, clock.now))
+
+        assert tm.next_timeout() == 2
+        tm.run()
+        assert calls == [('b', 1002.0)]
+        tm.run()
+        assert calls == [('b', 1002.0), ('a', 1003.0)]
+        tm.run()
+        assert calls[-1] == ('b', 1004.0)
+        assert clock.now == 1004.0
+
+    def test_run_max_wait(self, tm, clock):
+        tm.max_wait = 0.05
+
+        @tm.register(interval=1)
+        def func():
+            pass
+
+        assert tm.run() == []
+        assert clock.now == pytest.approx(1000.05)
+
+    def test_run_once(self, tm, clock):
+        @tm.register(interval=1, run_once=True)
+        def func():
+            pass
+
+        assert tm.run() == [1.0]
+        assert tm.get_timers() == {'0_func': 'Stopped'}
+        with pytest.raises(TimerError):
+            tm.run()
+
+    def test_no_timers_error_disabled(self, tm, clock):
+        tm.no_timers_err = False
+        assert tm.next_timeout() is None
+        assert tm.run() == []
+        assert clock.now == pytest.approx(1000.0 + blynktimer.WAIT_SEC)
+
+    def test_stop_start(self, tm, clock):
+        calls = []
+
+        @tm.register(interval=1)
+        def func1():
+            calls.append('func1')
+
+        @tm.register(interval=5)
+        def func2():
+            calls.append('func2')
+
+        tm.stop('0_func1')
+        assert tm.is_stopped('0_func1')
+        tm.run()
+        assert calls == ['func2']
+        tm.start('0_func1')
+        assert tm.next_timeout() == 1
+        tm.run()
+        assert calls == ['func2', 'func1']
+
+    def test_stopped_on_register(self, tm, clock):
+        @tm.register(interval=1, stopped=True)
+        def func():
+            pass
+
+        assert tm.next_timeout() is None
+        tm.start('0_func')
+        assert tm.next_timeout() == 1
+
+    def test_zero_interval(self, tm, clock):
+        @tm.register(interval=0)
+        def func():
+            pass
+
+        assert tm.run() == [0]
+        assert tm.run() == [0]
+
+    def test_max_timers(self, tm):
+        tm.max_timers = 1
+
+        @tm.register()
+        def func1():
+            pass
+
+        with pytest.raises(TimerError) as t_err:
+            @tm.register()
+            def func2():
+                pass
+        assert 'Max allowed timers num=1' in str(t_err.value)
+
+    def test_many_timers_order(self, tm, clock):
+        tm.max_timers = 1000
+        fired = []
+        for idx in range(1000):
+            tm.register(idx, interval=(idx * 7919) % 1000 + 1, run_once=True)(fired.append)
+        tm.run()
+        assert fired == [0]
+        while len(fired) < 1000:
+            tm.run()
+        assert fired == sorted(range(1000), key=lambda idx: (idx * 7919) % 1000)
+
+    def test_fixed_delay_drift(self, tm, clock, mocker):
+        calls = []
+        # every wait overshoots deadline
+        mocker.patch.object(blynktimer, 'polling_wait', side_effect=lambda sec: clock.wait(sec + 0.1))
+
+        @tm.register(interval=1)
+        def func():
+            calls.append(clock.now)
+
+        for _ in range(3):
+            tm.run()
+        assert calls == pytest.approx([1001.1, 1002.2, 1003.3])
+
+    def test_fixed_rate_no_drift(self, tm, clock, mocker):
+        calls = []
+        mocker.patch.object(blynktimer, 'polling_wait', side_effect=lambda sec: clock.wait(sec + 0.1))
+
+        @tm.register(interval=1, fixed_rate=True)
+        def func():
+            calls.append(clock.now)
+
+        for _ in range(3):
+            tm.run()
+        assert calls == pytest.approx([1001.1, 1002.1, 1003.1])
+
+    @pytest.mark.parametrize('catch_up, expected', [
+        ('burst', [1003.5, 1003.5, 1003.5, 1004.0]),
+        ('coalesce', [1003.5, 1004.0, 1005.0, 1006.0]),
+        ('skip', [1004.0, 1005.0, 1006.0, 1007.0]),
+    ])
+    def test_fixed_rate_catch_up(self, tm, clock, catch_up, expected):
+        calls = []
+
+        @tm.register(interval=1, fixed_rate=True, catch_up=catch_up)
+        def func():
+            calls.append(clock.now)
+
+        assert tm.next_timeout() == 1
+        # loop was blocked for 3.5 sec
+        clock.now += 3.5
+        while len(calls) < 4:
+            tm.run()
+        assert calls == expected
+
+    def test_unknown_catch_up_policy(self, tm):
+        with pytest.raises(TimerError):
+            tm.register(interval=1, fixed_rate=True, catch_up='unknown')
+
+    def test_blocking_timer(self, tm, clock):
+        import threading
+        release = threading.Event()
+        calls = []
+
+        @tm.register(interval=1, blocking=True)
+        def func():
+            calls.append(threading.current_thread())
+            release.wait(1)
+
+        assert tm.run() == [1.0]
+        assert tm.running_jobs() == 1
+        # run is skipped while previous one is in progress
+        assert tm.run() == []
+        release.set()
+        Timer._executor.shutdown(wait=True)
+        Timer._executor = None
+        assert tm.running_jobs() == 0
+        assert tm.run() == [2.0]
+        assert len(calls) == 2
+        assert threading.current_thread() not in calls
+
+    def test_raising_timer_keeps_schedule(self, tm, clock, mocker):
+        tm.log = mocker.Mock()
+        calls = []
+
+        @tm.register(interval=1)
+        def broken():
+            raise ValueError('boom')
+
+        @tm.register(interval=1)
+        def healthy():
+            calls.append(clock.now)
+
+        assert tm.run() == [1.0]
+        assert tm.run() == [1.0]
+        assert calls == [1001.0, 1002.0]
+        assert sorted(tm.get_timers().items()) == [('0_broken', 'Running'), ('1_healthy', 'Running')]
+        assert tm.log.call_count == 2
+        tm.log.assert_called_with('Timer 0_broken error: boom')
+
+    def test_blocking_timer_error_logged(self, tm, clock, mocker):
+        tm.log = mocker.Mock()
+
+        @tm.register(interval=1, blocking=True)
+        def broken():
+            raise ValueError('boom')
+
+        tm.run()
+        Timer._executor.shutdown(wait=True)
+        Timer._executor = None
+        tm.log.assert_called_once_with('Timer 0_broken error: boom')
+
+    def test_unknown_timer_id(self, tm):
+        with pytest.raises(TimerError):
+            tm.stop('1_unknown')
+
+    def test_profile(self, tm, clock, mocker):
+        tm._profile = {}
+        tm.log = mocker.Mock()
+
+        @tm.register(interval=1)
+        def fast():
+            clock.now += 0.01
+
+        @tm.register(interval=3)
+        def slow():
+            clock.now += 0.5
+
+        for _ in range(3):
+            tm.run()
+        stats = tm.profile_stats()
+        assert [item[:2] for item in stats] == [('1_slow', 1), ('0_fast', 3)]
+        assert stats[0][2:] == pytest.approx((500, 500))
+        assert stats[1][2:] == pytest.approx((30, 10))
+        # only run exceeding SLOW_RUN_MS is reported
+        tm.log.assert_called_once_with("[WARNING] Slow timer: ['1_slow'] took 500.0 ms")